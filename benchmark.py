@@ -0,0 +1,513 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import domain_check
+
+#All stages that can be benchmarked, see the benchmark_* functions
+stages = ['classification','memory','reading','parsing','matching','grep','output']
+#Output formats that are run end to end for each script
+output_formats = {'domain_check.py':['.txt','.csv','.xlsx','.parquet'],'domain_check_grep_version.py':['.txt']}
+
+
+##Synthetic data###############################
+
+def label_reference(word,key):
+    '''
+    Label a word like label() did before the classifier was precompiled:
+    each regex of dict_regex is checked with re.fullmatch one after the other
+
+    Args:
+        word (String): The word which is labeled
+        key  (String): The key given by the user (standard:email), None if the key was already found in the line
+
+    Returns:
+        label (String): The label of the word
+    '''
+    dict_regex = domain_check.dict_regex
+    if key is not None and key in dict_regex and re.fullmatch(dict_regex[key],word):
+        return key
+    for label in ['ip','url','phone_number','password']:
+        if re.fullmatch(dict_regex[label],word):
+            return label
+    return 'else'
+
+def random_tokens(num):
+    '''
+    Create a list of random words as they occur in a data leak
+
+    Args:
+        num (int): The number of words
+
+    Returns:
+        tokens (list): The list of words
+    '''
+    random.seed(0)
+    chars = 'abcdefghijklmnopqrstuvwxyz0123456789'
+    tokens = []
+    for i in range(num):
+        word = ''.join(random.choice(chars) for l in range(random.randint(4,12)))
+        kind = i%8
+        if kind==0:
+            tokens.append(word+'@'+random.choice(['web.de','bund.de','mail.bayern.de','gmail.com']))
+        elif kind==1:
+            tokens.append('.'.join(str(random.randint(0,300)) for l in range(4)))
+        elif kind==2:
+            tokens.append('https://www.'+word+'.de/login')
+        elif kind==3:
+            tokens.append('+49'+str(random.randint(10**9,10**11)))
+        elif kind==4:
+            tokens.append(word+'!'+word[:2].upper())
+        elif kind==5:
+            tokens.append(word+'ä ö')
+        else:
+            tokens.append(word)
+    return tokens
+
+def random_records(num):
+    '''
+    Create data points as they are stored by get_words_without_label()
+
+    Args:
+        num (int): The number of data points
+
+    Returns:
+        records (list): List of (email, list of all words of the data point)
+    '''
+    tokens = random_tokens(num*4)
+    records = []
+    for i in range(num):
+        email = 'user'+str(i)+'@'+random.choice(['web.de','bund.de','mail.bayern.de','gmail.com'])
+        records.append((email,[email]+tokens[i*4+1:i*4+4]))
+    return records
+
+def generate_domain_lists(folder,num_lists=4,num_domains=1000,seed=0):
+    '''
+    Write a synthetic Domainlisten folder: one list bund.txt and the other lists in the subfolder Bundeslaender
+
+    Args:
+        folder      (String): The path of the Domainlisten folder
+        num_lists   (int): The number of domain lists
+        num_domains (int): The number of domains in each list
+        seed        (int): The seed of the random generator
+
+    Returns:
+        domains (list): All domains in the lists
+    '''
+    random.seed(seed)
+    os.makedirs(folder+'/Bundeslaender',exist_ok=True)
+    domains = []
+    for i in range(num_lists):
+        name = 'bund' if i==0 else 'land'+str(i)
+        file = folder+'/bund.txt' if i==0 else folder+'/Bundeslaender/'+name+'.txt'
+        list_domains = ['amt'+str(j)+'.'+name+'.de' for j in range(num_domains-1)]+[name+'.de']
+        with open(file,'w') as f:
+            f.write('\n'.join(list_domains)+'\n')
+        domains.extend(list_domains)
+    return domains
+
+def generate_leak(file,size_mb,domains,delimiters=';,: \t',email_rate=0.9,hit_rate=0.3,duplicate_rate=0.1,seed=0):
+    '''
+    Write a synthetic data leak as txt file, each line has an email (or another key), a password and sometimes an ip, url or phone number
+
+    Args:
+        file           (String): The path of the file
+        size_mb        (float): The size of the file in megabytes
+        domains        (list): The domains of the Domainlisten (generated by generate_domain_lists)
+        delimiters     (String): The delimiters between the words, each line uses one of them
+        email_rate     (float): The share of the lines with an email address (the first line always has one)
+        hit_rate       (float): The share of the email addresses whose domain (or a subdomain of it) is in the Domainlisten
+        duplicate_rate (float): The share of the lines that repeat an earlier line
+        seed           (int): The seed of the random generator
+
+    Returns:
+        num (int): The number of lines
+    '''
+    random.seed(seed)
+    chars = 'abcdefghijklmnopqrstuvwxyz0123456789'
+    other_domains = ['web.de','gmail.com','gmx.net','yahoo.de','t-online.de']+['firma'+str(i)+'.com' for i in range(1000)]
+    size = int(size_mb*1000000)
+    written = 0
+    num = 0
+    recent = []
+    with open(file,'w',encoding='UTF-8') as f:
+        while written<size:
+            if recent and random.random()<duplicate_rate:
+                line = random.choice(recent)
+            else:
+                user = ''.join(random.choices(chars,k=random.randint(4,12)))
+                if num==0 or random.random()<email_rate:
+                    if random.random()<hit_rate:
+                        domain = random.choice(domains)
+                        if random.random()<0.2:
+                            domain = 'mail.'+domain
+                    else:
+                        domain = random.choice(other_domains)
+                    words = [user+'@'+domain]
+                else:
+                    words = [user]
+                words.append(''.join(random.choices(chars,k=random.randint(6,14)))+random.choice(['','!','#1','Ab']))
+                extra = random.random()
+                if extra<0.2:
+                    words.append('.'.join(str(random.randint(0,255)) for i in range(4)))
+                elif extra<0.3:
+                    words.append('https://www.'+user+'.de/login')
+                elif extra<0.35:
+                    words.append('+49'+str(random.randint(10**9,10**11)))
+                line = random.choice(delimiters).join(words)+'\n'
+                recent.append(line)
+                if len(recent)>10000:
+                    recent.pop(random.randrange(len(recent)))
+            f.write(line)
+            written += len(line.encode('UTF-8'))
+            num += 1
+    return num
+
+def generate_data(folder,args):
+    '''
+    Write a synthetic Domainlisten folder and data leak (leak.txt) to a folder
+
+    Args:
+        folder (String): The folder
+        args   (argparse.Namespace): The options of the data (see main)
+
+    Returns:
+        num (int): The number of lines in the data leak
+    '''
+    domains = generate_domain_lists(folder+'/Domainlisten',args.lists,args.domains,args.seed)
+    return generate_leak(folder+'/leak.txt',args.size_mb,domains,args.delimiters,args.email_rate,args.hit_rate,args.duplicate_rate,args.seed)
+
+##Benchmarks###############################
+
+def measure(function,repeat):
+    '''
+    Run a function several times
+
+    Args:
+        function (function): The function without arguments
+        repeat   (int): The number of repetitions
+
+    Returns:
+        seconds (float): The time of the fastest run
+        result  (object): The return value of the last run
+    '''
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter()-start)
+    return min(times),result
+
+def record(stage,name,seconds,items=None,num_bytes=None,**extra):
+    '''
+    Create the result of a benchmark and print it
+
+    Args:
+        stage     (String): The benchmarked stage
+        name      (String): The benchmarked variant
+        seconds   (float): The measured time
+        items     (int): The number of processed items (words, lines, emails, ...)
+        num_bytes (int): The number of processed bytes
+
+    Returns:
+        result (dict): The result, it is written as one json line to the output file
+    '''
+    result = {'stage':stage,'name':name,'seconds':round(seconds,6)}
+    line = '{:<12} {:<45} {:8.3f} s'.format(stage,name,seconds)
+    if items is not None:
+        result['items'] = items
+        result['items_per_second'] = round(items/seconds,1) if seconds>0 else None
+        line += '  {:12.0f} items/s'.format(items/seconds if seconds>0 else 0)
+    if num_bytes is not None:
+        result['bytes'] = num_bytes
+        result['mb_per_second'] = round(num_bytes/1e6/seconds,3) if seconds>0 else None
+        line += '  {:8.1f} MB/s'.format(num_bytes/1e6/seconds if seconds>0 else 0)
+    for key,value in extra.items():
+        result[key] = value
+        line += '  '+key+'='+str(value)
+    print(line)
+    return result
+
+def benchmark_classifier(num=200000,repeat=3):
+    '''
+    Compare the precompiled classifier with the sequential re.fullmatch calls of the old label() function
+
+    Args:
+        num    (int): The number of words that are labeled
+        repeat (int): The number of repetitions, the fastest is reported
+
+    Returns:
+        results (list): The results of the benchmarks
+    '''
+    tokens = random_tokens(num)
+    for key in ['email',None]:
+        assert [label_reference(word,key) for word in tokens]==[domain_check.classify_word(word,key) for word in tokens]
+    benchmarks = [
+        ('re.fullmatch per label (old label())',lambda: [label_reference(word,'email') for word in tokens]),
+        ('classify_word',lambda: [domain_check.classify_word(word,'email') for word in tokens]),
+        ('classify_words (batch)',lambda: domain_check.classify_words(tokens,'email')),
+    ]
+    return [record('classification',name,measure(function,repeat)[0],num) for name,function in benchmarks]
+
+def benchmark_memory(num=200000):
+    '''
+    Compare the memory of the old dict of lists (dict_key) with the RecordStore, measured with tracemalloc
+
+    Args:
+        num (int): The number of data points
+
+    Returns:
+        results (list): The results of the benchmarks
+    '''
+    records = random_records(num)
+    def dict_of_lists():
+        dict_key = {}
+        for email,words in records:
+            dict_key[email.encode().decode()] = [word.encode().decode() for word in words]
+        return dict_key
+    def record_store():
+        dict_key = domain_check.RecordStore()
+        for email,words in records:
+            dict_key.add(email,', '.join(words))
+        dict_key.finish()
+        return dict_key
+    results = []
+    for name,function in [('dict of lists (old dict_key)',dict_of_lists),('RecordStore',record_store)]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        store = function()
+        duration = time.perf_counter()-start
+        size,peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del store
+        results.append(record('memory',name,duration,num,memory_mb=round(size/1e6,1),peak_mb=round(peak/1e6,1)))
+    return results
+
+def benchmark_reading(file,repeat=3):
+    '''
+    Compare the bytes/second of the line reader that decodes every line (read_line_batches) with the memory-mapped email scanner (scan_email_lines),
+    the scanner also saves the time to split the lines without an email into words
+
+    Args:
+        file   (String): The path of the data leak
+        repeat (int): The number of repetitions, the fastest is reported
+
+    Returns:
+        results (list): The results of the benchmarks
+    '''
+    size = os.path.getsize(file)
+    def read(function):
+        num = 0
+        for lines,end in function(file,domain_check.default_buffer_size):
+            num += len(lines)
+        return num
+    results = []
+    for name,function in [('read_line_batches (decode all lines)',domain_check.read_line_batches),('scan_email_lines (mmap, bytes)',domain_check.scan_email_lines)]:
+        seconds,num = measure(lambda: read(function),repeat)
+        results.append(record('reading',name,seconds,num,size))
+    return results
+
+def read_email_lines(file):
+    '''
+    Returns:
+        lines (list): All lines of the data leak that can contain an email address
+    '''
+    lines = []
+    for block_lines,end in domain_check.scan_email_lines(file,domain_check.default_buffer_size):
+        lines.extend(block_lines)
+    return lines
+
+def benchmark_parsing(file,repeat=3):
+    '''
+    Measure how fast the lines are split into words and stored (txt output) or labeled (csv/xlsx/parquet output)
+
+    Args:
+        file   (String): The path of the data leak
+        repeat (int): The number of repetitions, the fastest is reported
+
+    Returns:
+        results (list): The results of the benchmarks
+    '''
+    size = os.path.getsize(file)
+    lines = read_email_lines(file)
+    domain_check.censor_password = False
+    results = []
+    for name,function in [('get_words_without_label (RecordStore)',domain_check.get_words_without_label),('get_words_with_label (dataframe)',domain_check.get_words_with_label)]:
+        seconds,result = measure(lambda: function(lines,'email'),repeat)
+        results.append(record('parsing',name,seconds,len(lines),size))
+    return results
+
+def benchmark_matching(folder,repeat=3):
+    '''
+    Measure how fast the domain index is built and the emails are matched against the domain index, 
+    for the txt output (check_emails_in_domain_txt) and for the csv/xlsx/parquet output (check_emails_in_domain_other)
+
+    Args:
+        folder (String): The folder with the Domainlisten and the data leak (leak.txt)
+        repeat (int): The number of repetitions, the fastest is reported
+
+    Returns:
+        results (list): The results of the benchmarks
+    '''
+    domain_check.domains_folder_name = folder+'/Domainlisten'
+    file_paths = domain_check.get_paths(folder+'/Domainlisten',False)
+    seconds,domain_index = measure(lambda: domain_check.build_domain_index(file_paths),repeat)
+    results = [record('matching','build_domain_index',seconds,len(domain_index))]
+    domain_check.domain_index = domain_index
+    domain_check.censor_password = False
+    emails = domain_check.get_words_without_label(read_email_lines(folder+'/leak.txt'),'email').keys()
+    seconds,(matches,unmatched) = measure(lambda: domain_check.check_emails_in_domain_txt(emails,0),repeat)
+    results.append(record('matching','check_emails_in_domain_txt (index)',seconds,len(emails),matches=len(matches),unmatched=len(unmatched)))
+    series = domain_check.pd.Series(emails)
+    seconds,domains = measure(lambda: domain_check.check_emails_in_domain_other(series),repeat)
+    results.append(record('matching','check_emails_in_domain_other (index)',seconds,len(emails),matches=int((domains!='other').sum())))
+    return results
+
+def benchmark_grep(folder,repeat=3):
+    '''
+    Measure the stages of domain_check_grep_version.py in the process: how fast the domain engine is built 
+    and the data leak is matched against it (check_emails_in_domain_txt reads the leak once and writes the results files).
+    The results files are written to folder/grep, the removed duplicate lines are reported as well.
+
+    Args:
+        folder (String): The folder with the Domainlisten and the data leak (leak.txt)
+        repeat (int): The number of repetitions, the fastest is reported
+
+    Returns:
+        results (list): The results of the benchmarks
+    '''
+    try:
+        #the grep version needs filesplit, only this stage depends on it
+        import domain_check_grep_version as grep_version
+    except ImportError as error:
+        print('The stage grep is skipped, domain_check_grep_version.py can not be imported: ',error)
+        return []
+    folder = os.path.abspath(folder)
+    grep_version.domains_folder_name = 'Domainlisten'
+    file_paths = grep_version.get_paths(folder+'/Domainlisten',False)
+    seconds,domain_engine = measure(lambda: grep_version.build_domain_engine(file_paths),repeat)
+    results = [record('grep','build_domain_engine',seconds,len(domain_engine))]
+    grep_version.domain_engine = domain_engine
+    leak = folder+'/leak.txt'
+    with open(leak,'rb') as f:
+        num = sum(1 for line in f)
+    def match():
+        if os.path.isdir('results'):
+            shutil.rmtree('results')
+        grep_version.seen_lines.clear()
+        grep_version.duplicates.clear()
+        grep_version.create_all_results_txtfiles(file_paths)
+        #the found lines of each domain file are printed, this is not measured on the console
+        with open(os.devnull,'w') as devnull, contextlib.redirect_stdout(devnull):
+            return grep_version.check_emails_in_domain_txt(leak)
+    cwd = os.getcwd()
+    os.makedirs(folder+'/grep',exist_ok=True)
+    os.chdir(folder+'/grep')
+    try:
+        seconds,dict_results = measure(match,repeat)
+    finally:
+        os.chdir(cwd)
+    results.append(record('grep','check_emails_in_domain_txt (engine)',seconds,num,os.path.getsize(leak),
+                          matches=sum(len(lines) for lines in dict_results.values()),duplicates=sum(grep_version.duplicates.values())))
+    return results
+
+def benchmark_output(folder,python=sys.executable):
+    '''
+    Run both scripts end to end on the data leak, once for each output format
+
+    Args:
+        folder (String): The folder with the Domainlisten and the data leak (leak.txt)
+        python (String): The python interpreter that runs the scripts
+
+    Returns:
+        results (list): The results of the benchmarks
+    '''
+    size = os.path.getsize(folder+'/leak.txt')
+    results = []
+    for script,formats in output_formats.items():
+        for out_format in formats:
+            for name in ['results','results.csv','results.xlsx','results.parquet','results_checkpoint.json','splitfiles']:
+                path = folder+'/'+name
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.isfile(path):
+                    os.remove(path)
+            start = time.perf_counter()
+            process = subprocess.run([python,os.path.dirname(os.path.abspath(__file__))+'/'+script,out_format,'leak.txt','Domainlisten'],
+                                     cwd=folder,input='n\n',capture_output=True,text=True)
+            seconds = time.perf_counter()-start
+            extra = {'returncode':process.returncode}
+            if process.returncode!=0:
+                extra['error'] = (process.stdout+process.stderr).strip().split('\n')[-1]
+            results.append(record('output',script+' '+out_format,seconds,None,size,**extra))
+    return results
+
+def git_revision():
+    '''
+    Returns:
+        revision (String): The git commit of the benchmarked code, None if it is not known
+    '''
+    try:
+        return subprocess.check_output(['git','rev-parse','--short','HEAD'],cwd=os.path.dirname(os.path.abspath(__file__)),stderr=subprocess.DEVNULL,text=True).strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of domain_check.py and domain_check_grep_version.py on synthetic data leaks')
+    parser.add_argument('--stages',default=','.join(stages),help='comma separated stages: '+', '.join(stages))
+    parser.add_argument('--words',type=int,default=200000,help='number of words/data points for the classification and memory benchmarks')
+    parser.add_argument('--size-mb',type=float,default=16,help='size of the synthetic data leak in megabytes')
+    parser.add_argument('--delimiters',default=';,: \\t',help='delimiters between the words (escape sequences like \\t are allowed)')
+    parser.add_argument('--email-rate',type=float,default=0.9,help='share of the lines with an email address')
+    parser.add_argument('--hit-rate',type=float,default=0.3,help='share of the emails whose domain is in the Domainlisten')
+    parser.add_argument('--duplicate-rate',type=float,default=0.1,help='share of the lines that repeat an earlier line')
+    parser.add_argument('--lists',type=int,default=4,help='number of synthetic domain lists')
+    parser.add_argument('--domains',type=int,default=1000,help='number of domains per list')
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--repeat',type=int,default=3,help='repetitions of each in-process benchmark, the fastest is reported')
+    parser.add_argument('--output',default='benchmark_results.jsonl',help='json lines file to which the results are appended')
+    parser.add_argument('--generate',metavar='FOLDER',help='only write the synthetic Domainlisten and leak.txt to FOLDER')
+    args = parser.parse_args()
+    args.delimiters = args.delimiters.encode().decode('unicode_escape')
+    if args.generate:
+        num = generate_data(args.generate,args)
+        print('Written ',num,' lines to ',args.generate+'/leak.txt and the Domainlisten to ',args.generate+'/Domainlisten')
+        return
+    selected = args.stages.split(',')
+    run = {'time':time.strftime('%Y-%m-%dT%H:%M:%S'),'revision':git_revision(),'python':sys.version.split()[0],
+           'options':{key:value for key,value in vars(args).items() if key not in ['output','generate']}}
+    results = []
+    if 'classification' in selected:
+        results += benchmark_classifier(args.words,args.repeat)
+    if 'memory' in selected:
+        results += benchmark_memory(args.words)
+    with tempfile.TemporaryDirectory() as folder:
+        if any(stage in selected for stage in ['reading','parsing','matching','grep','output']):
+            num = generate_data(folder,args)
+            print('Synthetic data leak: ',num,' lines, ',os.path.getsize(folder+'/leak.txt')//1000000,' MB')
+        if 'reading' in selected:
+            results += benchmark_reading(folder+'/leak.txt',args.repeat)
+        if 'parsing' in selected:
+            results += benchmark_parsing(folder+'/leak.txt',args.repeat)
+        if 'matching' in selected:
+            results += benchmark_matching(folder,args.repeat)
+        if 'grep' in selected:
+            results += benchmark_grep(folder,args.repeat)
+        if 'output' in selected:
+            results += benchmark_output(folder)
+    with open(args.output,'a') as f:
+        for result in results:
+            f.write(json.dumps(dict(run,**result))+'\n')
+    print('The results were appended to ',args.output)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,32 @@
+import asyncio
+import bz2
+import csv
 import gc
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import lzma
+import mmap
 import multiprocessing as mp
 import os
+import queue
 import re
+import resource
 import sys
+import threading
 import time
 import warnings
 import shutil
-import subprocess
+import zipfile
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-import numpy as np
 import pandas as pd
-from fsplit.filesplit import Filesplit
 from pandas.core.common import SettingWithCopyWarning
 from tqdm import tqdm
 
@@ -24,6 +40,74 @@ dict_regex['url'] = "http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-
 dict_regex['phone_number'] = "\+(9[976]\d|8[987530]\d|6[987]\d|5[90]\d|42\d|3[875]\d|2[98654321]\d|9[8543210]|8[6421]|6[6543210]|5[87654321]|4[987654310]|3[9643210]|2[70]|7|1)\d{1,14}$"
 dict_regex['password'] = "[A-Za-z\d@$!#%*?&\.\-\_]{2,50}$"
 
+#Columns of the dataframe for the .xlsx and .csv output
+columns = ['email', 'password','ip','url','phone_number','else','domain']
+
+#The regexes are compiled only once, they are used by is_key and classify_word
+compiled_regex = {key:re.compile(regex) for key,regex in dict_regex.items()}
+
+#Block size in bytes for the streaming mode (--stream), if buffer_size is None the input files are split into smaller files instead
+default_buffer_size = 16*1024*1024
+#The email scanner only jumps from '@' to '@' if at most this share of the lines in a sample of each block has an '@' (see scan_email_lines)
+scan_email_rate = 0.1
+scan_sample_size = 64*1024
+buffer_size = None
+
+#Compressed inputs are decompressed while they are read (see open_input), .zst needs the package zstandard
+compression_formats = ['.gz','.bz2','.xz','.zst']
+
+#Without the streaming mode the txt inputs are handled in chunks (byte ranges) that fit into the memory (see get_chunk_size),
+#chunk_size is set with --chunk-size, default_chunk_size is used if the available memory is not known
+chunk_size = None
+default_chunk_size = 50000000
+min_chunk_size = 1000000
+memory_factor = 10
+
+#Folder of the cached domain index, the index is only built again if a domain file has changed
+domain_index_cache = '.domain_index_cache'
+index_magic = b'DOMIDX1\0'
+
+#Number of processes that classify the emails (--workers), the emails are split into shards of at least min_shard_size emails
+num_workers = mp.cpu_count()
+min_shard_size = 10000
+worker_pool = None
+#In the pipeline mode (--pipeline) the blocks are read, parsed in the worker pool and written at the same time,
+#at most pipeline_depth blocks are read ahead, the number of blocks in the worker pool depends on num_workers (see run_pipeline)
+pipeline = False
+pipeline_depth = 4
+
+#Writer of the txt result files (only used for the .txt output)
+result_writer = None
+#Writer of the results.xlsx file (only used for the .xlsx output)
+excel_writer = None
+#Writer of the results.parquet dataset (only used for the .parquet output)
+parquet_writer = None
+#Writer of the results.csv file (only used for the .csv output)
+csv_writer = None
+#The chunks of the txt inputs that are handled in the worker pool (see run_scheduled_chunks), None if the chunks are handled one after another
+scheduled_chunks = None
+
+#Metrics of the run (timings of the stages, records/s, peak memory, ...) are written as json lines to the metrics file,
+#with --debug all matched emails are printed
+metrics_file = 'results_metrics.jsonl'
+debug = False
+
+#All results, the checkpoint manifest and the metrics are written to this folder (--output-dir), '' for the current directory
+output_dir = ''
+
+#Manifest of the processed chunks of each input file, with --resume the chunks that are done are skipped
+checkpoint_file = 'results_checkpoint.json'
+checkpoint = None
+resume = False
+
+#the batch mode never asks the user, so that runs can be scheduled (--batch, see ask)
+batch_mode = False
+#what to do if the first line has no word that matches the key: prompt, keep, auto or a key (see choose_fallback_key)
+fallback_key = 'prompt'
+key_preference = ['email','ip','url','phone_number','password']
+#the layout of the current input file, detected from a sample of its lines (see detect_input)
+input_layout = None
+
 
 
 def is_something(regex,word):
@@ -42,6 +126,71 @@ def is_something(regex,word):
     else:
         return False
 
+def is_key(word,key):
+    '''
+    Check if a word is the key, with the precompiled regex of the key
+
+    Args:
+        word (String): The word which is checked
+        key  (String): The key given by the user (standard:email) to sort by, i.e. most important information
+
+    Returns:
+        boolean: True, if word matches the regex of the key, else False
+    '''
+    regex = compiled_regex.get(key)
+    if regex is None or (key=='email' and '@' not in word):
+        return False
+    return regex.fullmatch(word) is not None
+
+def classify_word(word,key):
+    '''
+    Label a word as the key, ip, url, phone_number, password or else (in this order).
+    Cheap checks of the characters decide which regex is tried, so at most one regex is checked before the password regex.
+
+    Args:
+        word (String): The word which is labeled
+        key  (String): The key given by the user (standard:email), None if the key was already found in the line
+
+    Returns:
+        label (String): The label of the word
+    '''
+    if key is not None and is_key(word,key):
+        return key
+    first = word[0]
+    if first=='h':
+        if word.startswith('http') and compiled_regex['url'].fullmatch(word):
+            return 'url'
+    elif first=='+':
+        #a password can not contain a '+'
+        if compiled_regex['phone_number'].fullmatch(word):
+            return 'phone_number'
+        return 'else'
+    elif first in '0123456789':
+        if not word.strip('0123456789.') and compiled_regex['ip'].fullmatch(word):
+            return 'ip'
+    if compiled_regex['password'].fullmatch(word):
+        return 'password'
+    return 'else'
+
+def classify_words(words,key):
+    '''
+    Label all words of one line, only the first word that matches the key is labeled as the key.
+
+    Args:
+        words (list): All words (infos) that were given in the same line in the input file
+        key  (String): The key given by the user (standard:email) to sort by, i.e. most important information
+
+    Returns:
+        labels (list): The label of each word
+    '''
+    labels = []
+    for word in words:
+        word_label = classify_word(word,key)
+        if word_label==key:
+            key = None
+        labels.append(word_label)
+    return labels
+
 def get_paths(path,with_filenames):
     '''
     Get all files in a folder
@@ -83,6 +232,906 @@ def error_output(textmsg, errorcode, bol_programstop):
         print (errorcode)
         exit(1)
 
+##Instrumentation###############################
+
+class Metrics:
+    '''
+    Collects the metrics of a run: the time spent in each stage (detect, read, parse, label, match, write, dedup, schedule), 
+    the number of handled records and bytes, the peak memory (RSS), the busy time of each worker process and the queue depth of the result writer.
+    After each chunk and at the end of the run a json line is written to the metrics file.
+    '''
+
+    def __init__(self,metrics_file=None):
+        '''
+        Args:
+            metrics_file (String): The path of the metrics file (json lines), None if the metrics are only collected
+        '''
+        self.metrics_file = metrics_file
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.records = 0
+        self.bytes = 0
+        self.chunk_bytes = 0
+        self.chunks = 0
+        self.workers = {}
+        self.max_queue_depth = 0
+        if metrics_file is not None:
+            self.file = open(metrics_file,'a')
+            self.write_line({'event':'start','pid':os.getpid(),'workers':num_workers,'buffer_size':buffer_size})
+
+    @contextmanager
+    def stage(self,name):
+        '''
+        Measure the time of a stage, i.e. with metrics.stage('parse'): ...
+
+        Args:
+            name (String): The name of the stage
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name,time.perf_counter()-start)
+
+    def add_time(self,name,seconds):
+        '''
+        Add the time of one call of a stage (also called from the writer thread)
+
+        Args:
+            name    (String): The name of the stage
+            seconds (float): The time of the call
+        '''
+        with self.lock:
+            stage = self.stages.setdefault(name,{'seconds':0.0,'calls':0})
+            stage['seconds'] += seconds
+            stage['calls'] += 1
+
+    def add_stages(self,stages):
+        '''
+        Add the times of the stages of another process (i.e. of a worker which handled a chunk)
+
+        Args:
+            stages (dict): The stages of the other process with their time and number of calls
+        '''
+        with self.lock:
+            for name,values in stages.items():
+                stage = self.stages.setdefault(name,{'seconds':0.0,'calls':0})
+                stage['seconds'] += values['seconds']
+                stage['calls'] += values['calls']
+
+    def timed(self,batches,name='read'):
+        '''
+        Measure the time that is spent in a generator, i.e. the time to read the next batch of lines
+
+        Args:
+            batches (generator): The generator of batches
+            name    (String): The name of the stage
+
+        Yields:
+            batch: The batches of the generator
+        '''
+        batches = iter(batches)
+        while True:
+            start = time.perf_counter()
+            try:
+                batch = next(batches)
+            except StopIteration:
+                self.add_time(name,time.perf_counter()-start)
+                return
+            self.add_time(name,time.perf_counter()-start)
+            yield batch
+
+    def add_bytes(self,num_bytes):
+        '''
+        Count the bytes of the input that were read
+
+        Args:
+            num_bytes (int): The number of bytes
+        '''
+        self.bytes += num_bytes
+        self.chunk_bytes += num_bytes
+
+    def add_worker_time(self,worker,seconds,num):
+        '''
+        Add the busy time of a worker process for one shard
+
+        Args:
+            worker  (int): The process id of the worker
+            seconds (float): The time the worker needed for the shard
+            num     (int): The number of emails in the shard
+        '''
+        worker = self.workers.setdefault(str(worker),{'busy_seconds':0.0,'shards':0,'emails':0})
+        worker['busy_seconds'] += seconds
+        worker['shards'] += 1
+        worker['emails'] += num
+
+    def chunk(self,file,records):
+        '''
+        Count the records of a handled chunk and write a json line with the state after the chunk
+
+        Args:
+            file    (String): The input file of the chunk
+            records (int): The number of records (lines) in the chunk
+        '''
+        self.records += records
+        self.chunks += 1
+        queue_depth = result_writer.queue.qsize() if isinstance(result_writer,ResultWriter) else 0
+        self.max_queue_depth = max(self.max_queue_depth,queue_depth)
+        self.write_line({'event':'chunk','file':file,'records':records,'bytes':self.chunk_bytes,'seconds':round(time.perf_counter()-self.start,3),
+                         'queue_depth':queue_depth,'peak_rss_mb':peak_rss_mb()})
+        self.chunk_bytes = 0
+
+    def summary(self):
+        '''
+        Returns:
+            summary (dict): The metrics of the whole run
+        '''
+        seconds = time.perf_counter()-self.start
+        #the workers are busy during the matching, or during the whole schedule if the chunks are handled in the worker pool
+        match_seconds = self.stages.get('schedule',self.stages.get('match',{})).get('seconds',0)
+        workers = {}
+        for worker,values in self.workers.items():
+            workers[worker] = dict(values,utilisation=round(values['busy_seconds']/match_seconds,3) if match_seconds>0 else None)
+        return {'event':'summary','seconds':round(seconds,3),'records':self.records,'bytes':self.bytes,'chunks':self.chunks,
+                'records_per_second':round(self.records/seconds,1),'bytes_per_second':round(self.bytes/seconds,1),
+                'stages':{name:{'seconds':round(stage['seconds'],3),'calls':stage['calls']} for name,stage in self.stages.items()},
+                'peak_rss_mb':peak_rss_mb(),'workers':workers,'max_queue_depth':self.max_queue_depth}
+
+    def close(self):
+        '''
+        Print the summary of the run and write it to the metrics file
+
+        Returns:
+            summary (dict): The metrics of the whole run
+        '''
+        summary = self.summary()
+        print()
+        print('Metrics of the run (',summary['records'],' records, ',summary['bytes'],' bytes, ',summary['records_per_second'],' records/s, ',
+              summary['bytes_per_second'],' bytes/s, peak RSS ',summary['peak_rss_mb'],' MB):')
+        for name,stage in summary['stages'].items():
+            print('{:<8} {:10.3f} s  {:8d} calls'.format(name,stage['seconds'],stage['calls']))
+        for worker,values in summary['workers'].items():
+            print('worker ',worker,': ',values['shards'],' shards, utilisation ',values['utilisation'])
+        if self.metrics_file is not None:
+            self.write_line(summary)
+            self.file.close()
+            print('The metrics were written to ',self.metrics_file)
+        print()
+        return summary
+
+    def write_line(self,line):
+        '''
+        Write a json line to the metrics file
+
+        Args:
+            line (dict): The content of the line
+        '''
+        if self.metrics_file is not None:
+            self.file.write(json.dumps(dict(line,time=time.strftime('%Y-%m-%dT%H:%M:%S')))+'\n')
+            self.file.flush()
+
+def peak_rss_mb():
+    '''
+    Returns:
+        peak_rss (float): The peak resident memory of the program plus the largest finished child process in megabytes
+    '''
+    #ru_maxrss is given in kilobytes on linux
+    return round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss+resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)/1024,1)
+
+#The metrics are always collected, main() sets a metrics file
+metrics = Metrics()
+
+##Functions for the domain index###############################
+
+def build_domain_index(file_paths):
+    '''
+    Build an index of all domains in the Domainlist once, so that each email can be classified by looking up the suffixes of its host.
+
+    Args:
+        file_paths (list): All file_paths in Domainlisten
+
+    Returns:
+        domain_index (dict): A dictionary with each (lowercased) domain as key 
+                             and the list of domain files (path inside Domainlisten) in which the domain is listed as value
+
+    '''
+    domain_index = {}
+    for file in file_paths:
+        file_name = file.split(domains_folder_name+'/',1)[1]
+        with open(file) as f:
+            for line in f:
+                line = line.strip().lower()
+                if not line:
+                    continue
+                file_names = domain_index.setdefault(line,[])
+                if file_name not in file_names:
+                    file_names.append(file_name)
+    return domain_index
+
+def domain_index_cache_key(file_paths,version):
+    '''
+    Compute the key of the cached domain index, i.e. a hash of the paths, modification times and contents of all domain files
+
+    Args:
+        file_paths (list): All file_paths in Domainlisten
+        version    (String): The hash of the paths and contents of the Domainlist (generated by domain_index_version)
+
+    Returns:
+        cache_key (String): The key of the cached domain index
+    '''
+    sha = hashlib.sha1(version.encode())
+    for file in sorted(file_paths):
+        sha.update(file.split(domains_folder_name+'/',1)[1].encode()+b'\0'+str(os.stat(file).st_mtime_ns).encode()+b'\0')
+    return sha.hexdigest()
+
+def save_domain_index(domain_index,cache_file):
+    '''
+    Write the domain index as a binary file to the cache.
+    The file starts with index_magic and the length of a json header, the header holds the sets of domain files.
+    It is followed by all domains separated by line breaks and an array with the number of the set of domain files of each domain.
+
+    Args:
+        domain_index (dict): The domain index (generated by build_domain_index)
+        cache_file   (String): The path of the cached domain index
+    '''
+    sets = {}
+    set_ids = array('I')
+    for file_names in domain_index.values():
+        set_ids.append(sets.setdefault(tuple(file_names),len(sets)))
+    domains = '\n'.join(domain_index.keys()).encode('UTF-8')
+    header = json.dumps({'sets':[list(file_names) for file_names in sets],'domains_length':len(domains),'count':len(set_ids)}).encode()
+    if not os.path.exists(domain_index_cache):
+        os.makedirs(domain_index_cache)
+    #each process writes its own temporary file, so that processes which build the index at the same time don't overwrite each other
+    tmp_file = cache_file+'.'+str(os.getpid())+'.tmp'
+    with open(tmp_file,'wb') as f:
+        f.write(index_magic)
+        f.write(len(header).to_bytes(4,'little'))
+        f.write(header)
+        f.write(domains)
+        f.write(set_ids.tobytes())
+    os.replace(tmp_file,cache_file)
+
+def load_domain_index(cache_file):
+    '''
+    Read the cached domain index through a memory map
+
+    Args:
+        cache_file (String): The path of the cached domain index
+
+    Returns:
+        domain_index (dict): The domain index (see build_domain_index), None if the cached file can't be read
+    '''
+    try:
+        with open(cache_file,'rb') as f, mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ) as mm:
+            if mm[:len(index_magic)]!=index_magic:
+                return None
+            header_length = int.from_bytes(mm[len(index_magic):len(index_magic)+4],'little')
+            start = len(index_magic)+4
+            header = json.loads(mm[start:start+header_length])
+            start += header_length
+            domains = mm[start:start+header['domains_length']].decode('UTF-8').split('\n') if header['count']>0 else []
+            set_ids = array('I')
+            set_ids.frombytes(mm[start+header['domains_length']:])
+    except (OSError,ValueError) as error:
+        print('The cached domain index could not be read, it is built again: ',error)
+        return None
+    if len(domains)!=header['count'] or len(set_ids)!=header['count']:
+        return None
+    sets = header['sets']
+    return {domain:sets[set_id] for domain,set_id in zip(domains,set_ids)}
+
+def get_domain_index(file_paths,version):
+    '''
+    Load the domain index from the cache, the index is only built again (and written to the cache) if a domain file has changed
+
+    Args:
+        file_paths (list): All file_paths in Domainlisten
+        version    (String): The hash of the paths and contents of the Domainlist (generated by domain_index_version)
+
+    Returns:
+        domain_index (dict): The domain index (see build_domain_index)
+    '''
+    cache_file = domain_index_cache+'/'+domain_index_cache_key(file_paths,version)+'.idx'
+    if os.path.isfile(cache_file):
+        domain_index = load_domain_index(cache_file)
+        if domain_index is not None:
+            print('The domain index was loaded from the cache: ',cache_file)
+            return domain_index
+    domain_index = build_domain_index(file_paths)
+    save_domain_index(domain_index,cache_file)
+    #only the index of the current Domainlist is kept in the cache, the temporary files of other processes are not removed
+    for file in os.listdir(domain_index_cache):
+        if domain_index_cache+'/'+file!=cache_file and not file.endswith('.tmp'):
+            try:
+                os.remove(domain_index_cache+'/'+file)
+            except FileNotFoundError:
+                #another process has already removed the file
+                pass
+    print('The domain index was built and written to the cache: ',cache_file)
+    return domain_index
+
+def lookup_domain(email,domain_index):
+    '''
+    Find all domain files to which the domain of an email belongs.
+    The suffixes of the host are walked from the longest to the shortest, 
+    i.e. for info@vgem-betzenstein.bayern.de: vgem-betzenstein.bayern.de, bayern.de, de
+
+    Args:
+        email (String): The email address
+        domain_index (dict): The domain index (generated by build_domain_index)
+
+    Returns:
+        file_names (list): The list of domain files (path inside Domainlisten), empty if the domain is not in the Domainlist
+
+    '''
+    host = email.rsplit('@',1)[-1].lower()
+    file_names = []
+    while host:
+        for file_name in domain_index.get(host,()):
+            if file_name not in file_names:
+                file_names.append(file_name)
+        host = host.partition('.')[2]
+    return file_names
+
+def init_worker(index):
+    '''
+    Initialise a process of the worker pool, the domain index is sent only once to each process
+
+    Args:
+        index (dict): The domain index (generated by build_domain_index)
+
+    '''
+    global domain_index
+    domain_index = index
+
+def match_shard(emails,offset):
+    '''
+    Classify a shard of emails in a process of the worker pool and measure how long the worker was busy
+
+    Args:
+        emails (list): The emails of the shard
+        offset (int): The position of the first email in the list of all emails
+
+    Returns:
+        matches   (list): The matches of the shard (see check_emails_in_domain_txt)
+        unmatched (list): The positions of the emails of the shard that are not in the Domainlist
+        worker    (int): The process id of the worker
+        seconds (float): The time the worker needed for the shard
+    '''
+    start = time.perf_counter()
+    matches,unmatched = check_emails_in_domain_txt(emails,offset)
+    return matches,unmatched,os.getpid(),time.perf_counter()-start
+
+def start_worker_pool():
+    '''
+    Start the pool of processes which classify the shards of emails (only if more than one worker is used or in the pipeline mode)
+
+    Returns:
+        pool (multiprocessing.Pool): The worker pool or None
+    '''
+    if num_workers<=1 and not pipeline:
+        return None
+    print('Number of parallel cores used for multiprocessing: ',num_workers)
+    return mp.Pool(num_workers,initializer=init_worker,initargs=(domain_index,))
+
+def get_shards(lst):
+    '''
+    Get the positions at which a list is split into shards for the worker pool
+
+    Args:
+        lst (list): The list which should be split
+
+    Returns:
+        shards (list): List of (start, end) positions of each shard
+    '''
+    shard_size = max(min_shard_size,-(-len(lst)//(num_workers*4)))
+    return [(i,min(i+shard_size,len(lst))) for i in range(0,len(lst),shard_size)]
+
+##Functions for the checkpoint manifest###############################
+
+def domain_index_version(file_paths):
+    '''
+    Compute a version of the Domainlist, i.e. a hash of the paths and contents of all domain files
+
+    Args:
+        file_paths (list): All file_paths in Domainlisten
+
+    Returns:
+        version (String): The hash of the Domainlist
+    '''
+    sha = hashlib.sha1()
+    for file in sorted(file_paths):
+        sha.update(file.split(domains_folder_name+'/',1)[1].encode()+b'\0')
+        with open(file,'rb') as f:
+            sha.update(f.read())
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+def file_fingerprint(file):
+    '''
+    Compute a content hash of an input file from its size and its first and last megabyte, so that large files don't have to be read completely
+
+    Args:
+        file (String): The file path of the input file
+
+    Returns:
+        fingerprint (String): The hash of the file
+    '''
+    archive,member = split_zip_member(file)
+    if archive is not None:
+        #the zip file contains the size and the CRC of each member
+        with zipfile.ZipFile(archive) as zip_file:
+            info = zip_file.getinfo(member)
+        return hashlib.sha1((str(info.file_size)+':'+str(info.CRC)).encode()).hexdigest()
+    size = os.path.getsize(file)
+    sha = hashlib.sha1(str(size).encode())
+    with open(file,'rb') as f:
+        sha.update(f.read(1000000))
+        if size>1000000:
+            f.seek(max(1000000,size-1000000))
+            sha.update(f.read())
+    return sha.hexdigest()
+
+def save_checkpoint():
+    '''
+    Write the checkpoint manifest atomically, i.e. to a temporary file which then replaces the manifest
+    '''
+    temp_file = checkpoint_file+'.tmp'
+    with open(temp_file,'w') as f:
+        json.dump(checkpoint,f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file,checkpoint_file)
+
+def load_checkpoint(version,key,out_format):
+    '''
+    Load the checkpoint manifest of the last run, it is only used if the Domainlist, the key and the output format are the same
+
+    Args:
+        version    (String): The version of the Domainlist (generated by domain_index_version)
+        key        (String): The key given by the user (standard:email) to sort by, i.e. most important information
+        out_format (String): The user-specified output format
+
+    Returns:
+        checkpoint (dict): The manifest or None if the last run can not be resumed
+    '''
+    if not os.path.isfile(checkpoint_file):
+        print('There is no checkpoint of a previous run, the program starts from the beginning.')
+        return None
+    with open(checkpoint_file) as f:
+        manifest = json.load(f)
+    if manifest.get('domain_index_version')!=version:
+        print('The Domainlist has changed since the last run, the program starts from the beginning.')
+        return None
+    if manifest.get('key')!=key or manifest.get('out_format')!=out_format:
+        print('The key or the output format has changed since the last run, the program starts from the beginning.')
+        return None
+    return manifest
+
+def register_input_file(file):
+    '''
+    Add an input file to the checkpoint manifest. If the file has changed since the last run, its processed chunks are forgotten.
+
+    Args:
+        file (String): The file path of the input file
+
+    Returns:
+        entry (dict): The entry of the file in the manifest with the content hash, the size, the processed chunks 
+                      and the byte offset up to which the file has been processed
+    '''
+    path = os.path.abspath(file)
+    fingerprint = file_fingerprint(file)
+    entry = checkpoint['files'].get(path)
+    if entry is None or entry['hash']!=fingerprint:
+        if entry is not None:
+            print('The file ',file,' has changed since the last run and will be processed again.')
+        entry = {'hash':fingerprint,'size':input_size(file),'done':[],'offset':0}
+        checkpoint['files'][path] = entry
+        save_checkpoint()
+    return entry
+
+def get_checkpoint_offset(file):
+    '''
+    Get the byte offset up to which an input file has been processed
+
+    Args:
+        file (String): The file path of the input file
+
+    Returns:
+        offset (int): The byte offset, 0 if the file is not in the manifest
+    '''
+    entry = checkpoint['files'].get(os.path.abspath(file))
+    if entry is None:
+        return 0
+    return entry['offset']
+
+def is_chunk_done(file,start,end):
+    '''
+    Check if a chunk of an input file has already been processed
+
+    Args:
+        file  (String): The file path of the input file
+        start (int): The byte position where the chunk starts
+        end   (int): The byte position where the chunk ends
+
+    Returns:
+        boolean: True, if the chunk has been processed, else False
+    '''
+    entry = checkpoint['files'].get(os.path.abspath(file))
+    if entry is None:
+        return False
+    return any(done_start<=start and end<=done_end for done_start,done_end in entry['done'])
+
+def mark_chunk_done(file,start,end):
+    '''
+    Note in the checkpoint manifest that a chunk of an input file has been processed and write the manifest.
+    The xlsx and parquet writers only have the rows of a chunk on disk after they have saved their files, 
+    so they note the chunk themselves when the file is saved (see ExcelResultWriter and ParquetResultWriter).
+
+    Args:
+        file  (String): The file path of the input file
+        start (int): The byte position where the chunk starts
+        end   (int): The byte position where the chunk ends
+
+    Returns:
+        void
+    '''
+    #the chunk is only done when all its results are in the result files
+    if result_writer is not None:
+        result_writer.flush()
+    for writer in (excel_writer,parquet_writer):
+        if writer is not None:
+            writer.chunk_done(file,start,end)
+            return
+    note_chunk_done(file,start,end)
+
+def note_chunk_done(file,start,end):
+    '''
+    Add a chunk of an input file whose results are on disk to the processed chunks in the checkpoint manifest and write the manifest
+
+    Args:
+        file  (String): The file path of the input file
+        start (int): The byte position where the chunk starts
+        end   (int): The byte position where the chunk ends
+
+    Returns:
+        void
+    '''
+    entry = checkpoint['files'].get(os.path.abspath(file))
+    if entry is None:
+        return
+    done = []
+    for chunk in sorted(entry['done']+[[start,end]]):
+        if done and chunk[0]<=done[-1][1]:
+            done[-1][1] = max(done[-1][1],chunk[1])
+        else:
+            done.append(chunk)
+    entry['done'] = done
+    if done[0][0]==0:
+        entry['offset'] = done[0][1]
+    save_checkpoint()
+
+##Writer for the txt result files###############################
+
+class ResultWriter:
+    '''
+    Writer for the txt result files. The lines for each result file are collected in memory and written in large blocks.
+    Only the writer thread opens the result files, it keeps at most max_open_files files open (the least recently used file is closed first).
+    All other parts of the program (and the results of the worker pool) only put lines into the queue of the writer.
+
+    Each line is only written once to a result file: the writer keeps the hashes of all lines of each result file.
+    If dedup_memory is set, at most dedup_memory lines per result file are kept in memory, they are sorted by their hash 
+    and spilled as runs to results/.dedup_runs. For a checkpoint the new lines in memory are only appended to a journal (pending.txt) next to the runs,
+    so a new run is only written when dedup_memory is reached. When the writer is closed, the runs are merged (at most merge_fan_in runs at once) 
+    and each result file is written sorted by hash.
+    '''
+
+    def __init__(self,max_open_files=64,block_size=1000000,max_buffered=64000000,dedup_memory=None,merge_fan_in=64):
+        '''
+        Start the writer thread
+
+        Args:
+            max_open_files (int): The maximal number of result files that are open at the same time
+            block_size     (int): The number of buffered bytes of one result file after which the buffer is written
+            max_buffered   (int): The number of buffered bytes of all result files after which all buffers are written
+            dedup_memory   (int): The number of lines per result file that are kept in memory for the deduplication, None if all hashes are kept
+            merge_fan_in   (int): The maximal number of runs that are merged (and open) at the same time
+        '''
+        self.max_open_files = max_open_files
+        self.block_size = block_size
+        self.max_buffered = max_buffered
+        self.dedup_memory = dedup_memory
+        self.merge_fan_in = merge_fan_in
+        self.queue = queue.Queue(maxsize=1000)
+        self.files = OrderedDict()
+        self.buffers = {}
+        self.buffer_sizes = {}
+        self.buffered = 0
+        self.seen = {}
+        self.runs = {}
+        self.run_numbers = {}
+        self.journal = {}
+        self.duplicates = {}
+        self.error = None
+        self.thread = threading.Thread(target=self.run,daemon=True)
+        self.thread.start()
+
+    def write(self,result_file,lines):
+        '''
+        Put lines for a result file into the queue of the writer
+
+        Args:
+            result_file (String): The path of the result file
+            lines       (list): The lines (without line break) that are appended to the result file, as Strings or UTF-8 encoded bytes/memoryviews
+        '''
+        if lines:
+            self.queue.put((result_file,lines))
+
+    def flush(self):
+        '''
+        Wait until all lines in the queue have been written to the result files (or to the runs on disk)
+        '''
+        done = threading.Event()
+        self.queue.put(('flush',done))
+        done.wait()
+        self.check_error()
+
+    def close(self):
+        '''
+        Write all remaining lines, close all result files and stop the writer thread
+
+        Returns:
+            duplicates (dict): A dictionary with the result file as key and the number of removed duplicate lines as value
+        '''
+        self.queue.put(None)
+        self.thread.join()
+        self.check_error()
+        print()
+        print('Duplicate lines that were removed from the result files:')
+        for result_file,num in sorted(self.duplicates.items()):
+            if num>0:
+                print(result_file,': ',num)
+        print()
+        return self.duplicates
+
+    def check_error(self):
+        '''
+        Stop the program if the writer thread could not write a result file
+        '''
+        if self.error is not None:
+            error_output("when writing the result files", self.error, 1)
+
+    def run(self):
+        '''
+        The loop of the writer thread, it takes the lines out of the queue and buffers the new lines per result file
+        '''
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    self.flush_all()
+                    for f in self.files.values():
+                        f.close()
+                    self.files.clear()
+                    if self.dedup_memory is not None:
+                        self.merge_runs()
+                    return
+                if item[0]=='flush':
+                    self.flush_all()
+                    for f in self.files.values():
+                        f.flush()
+                    item[1].set()
+                    continue
+                result_file,lines = item
+                start = time.perf_counter()
+                if result_file not in self.seen:
+                    self.load_result_file(result_file)
+                seen = self.seen[result_file]
+                new_lines = []
+                for line in lines:
+                    line = line.encode('UTF-8',errors='ignore') if isinstance(line,str) else bytes(line)
+                    line_hash = hashlib.blake2b(line,digest_size=16).digest()
+                    if line_hash in seen:
+                        continue
+                    if self.dedup_memory is None:
+                        seen.add(line_hash)
+                    else:
+                        seen[line_hash] = line
+                        self.journal[result_file].append((line_hash,line))
+                    new_lines.append(line)
+                self.duplicates[result_file] += len(lines)-len(new_lines)
+                metrics.add_time('dedup',time.perf_counter()-start)
+                if not new_lines:
+                    continue
+                if self.dedup_memory is not None:
+                    if len(seen)>=self.dedup_memory:
+                        self.spill_run(result_file)
+                    continue
+                text = b'\n'.join(new_lines)+b'\n'
+                self.buffers.setdefault(result_file,[]).append(text)
+                self.buffer_sizes[result_file] = self.buffer_sizes.get(result_file,0)+len(text)
+                self.buffered += len(text)
+                if self.buffer_sizes[result_file]>=self.block_size:
+                    self.flush_file(result_file)
+                elif self.buffered>=self.max_buffered:
+                    self.flush_all()
+            except Exception as error:
+                self.error = error
+                if item is not None and item[0]=='flush':
+                    item[1].set()
+                if item is None:
+                    return
+
+    def load_result_file(self,result_file):
+        '''
+        Start the deduplication of a result file, the lines that are already in the result file (i.e. from a resumed run) are taken into account
+
+        Args:
+            result_file (String): The path of the result file
+        '''
+        self.duplicates[result_file] = 0
+        if self.dedup_memory is None:
+            self.seen[result_file] = set()
+            if os.path.isfile(result_file):
+                with open(result_file,'rb') as f:
+                    for line in f:
+                        self.seen[result_file].add(hashlib.blake2b(line.rstrip(b'\n'),digest_size=16).digest())
+            return
+        #the lines of the result file become runs, the result file is written again when the runs are merged
+        self.seen[result_file] = {}
+        self.journal[result_file] = []
+        run_folder = output_dir+'results/.dedup_runs/'+hashlib.sha1(result_file.encode()).hexdigest()
+        self.runs[result_file] = run_folder
+        if not os.path.exists(run_folder):
+            os.makedirs(run_folder)
+            with open(run_folder+'/result_file','w') as f:
+                f.write(result_file)
+        run_numbers = [int(run_file[4:-4]) for run_file in os.listdir(run_folder) if run_file.startswith('run_')]
+        self.run_numbers[result_file] = max(run_numbers)+1 if run_numbers else 0
+        #the journal of a previous run contains the lines that were in memory at its last checkpoint
+        if os.path.isfile(run_folder+'/pending.txt'):
+            with open(run_folder+'/pending.txt','rb') as f:
+                for record in f:
+                    line_hash,line = record.rstrip(b'\n').split(b'\t',1)
+                    self.seen[result_file][bytes.fromhex(line_hash.decode())] = line
+                    if len(self.seen[result_file])>=self.dedup_memory:
+                        self.spill_run(result_file)
+        if os.path.isfile(result_file):
+            with open(result_file,'rb') as f:
+                for line in f:
+                    line = line.rstrip(b'\n')
+                    self.seen[result_file][hashlib.blake2b(line,digest_size=16).digest()] = line
+                    if len(self.seen[result_file])>=self.dedup_memory:
+                        self.spill_run(result_file)
+            self.spill_run(result_file)
+            os.remove(result_file)
+
+    def spill_run(self,result_file):
+        '''
+        Write the lines of a result file that are in memory sorted by their hash as a run to disk, the journal of these lines is not needed anymore
+
+        Args:
+            result_file (String): The path of the result file
+        '''
+        seen = self.seen[result_file]
+        if not seen:
+            return
+        run_folder = self.runs[result_file]
+        run_file = run_folder+'/run_'+str(self.run_numbers[result_file])+'.txt'
+        self.run_numbers[result_file] += 1
+        with open(run_file,'wb') as f:
+            for line_hash in sorted(seen):
+                f.write(line_hash.hex().encode()+b'\t'+seen[line_hash]+b'\n')
+        seen.clear()
+        self.journal[result_file] = []
+        if os.path.isfile(run_folder+'/pending.txt'):
+            os.remove(run_folder+'/pending.txt')
+
+    def write_journal(self,result_file):
+        '''
+        Append the lines of a result file that came into memory since the last checkpoint to the journal of the result file
+
+        Args:
+            result_file (String): The path of the result file
+        '''
+        if not self.journal[result_file]:
+            return
+        with open(self.runs[result_file]+'/pending.txt','ab') as f:
+            f.write(b''.join(line_hash.hex().encode()+b'\t'+line+b'\n' for line_hash,line in self.journal[result_file]))
+        self.journal[result_file] = []
+
+    def merge_runs(self):
+        '''
+        Merge the runs of all result files (also the runs that were left by a previous run of the program) 
+        and write each line only once to its result file. If a result file has more than merge_fan_in runs, 
+        groups of merge_fan_in runs are merged into new runs first, so never more than merge_fan_in runs are open at once.
+        '''
+        if not os.path.exists(output_dir+'results/.dedup_runs'):
+            return
+        with metrics.stage('dedup'):
+            for run_folder in os.listdir(output_dir+'results/.dedup_runs'):
+                run_folder = output_dir+'results/.dedup_runs/'+run_folder
+                with open(run_folder+'/result_file') as f:
+                    result_file = f.read()
+                if result_file not in self.seen:
+                    #a result file of a previous run of the program, its journal is loaded as well
+                    self.load_result_file(result_file)
+                self.spill_run(result_file)
+                run_files = [run_folder+'/'+run_file for run_file in os.listdir(run_folder) if run_file.startswith('run_')]
+                while len(run_files)>self.merge_fan_in:
+                    merged = []
+                    for i in range(0,len(run_files),self.merge_fan_in):
+                        group = run_files[i:i+self.merge_fan_in]
+                        if len(group)==1:
+                            merged += group
+                            continue
+                        run_file = run_folder+'/run_'+str(self.run_numbers[result_file])+'.txt'
+                        self.run_numbers[result_file] += 1
+                        self.merge_run_files(group,run_file,result_file,True)
+                        merged.append(run_file)
+                    run_files = merged
+                self.merge_run_files(run_files,result_file,result_file,False)
+                shutil.rmtree(run_folder)
+            shutil.rmtree(output_dir+'results/.dedup_runs')
+
+    def merge_run_files(self,run_files,out_file,result_file,keep_hash):
+        '''
+        Merge sorted runs into one file, the lines that are in several runs are only written once. The merged runs are deleted.
+
+        Args:
+            run_files   (list): The paths of the runs
+            out_file    (String): The path of the file the merged lines are appended to
+            result_file (String): The result file the runs belong to (for the count of the duplicates)
+            keep_hash   (boolean): True to write a new run (hash and line), False to write only the lines
+        '''
+        files = [open(run_file,'rb') for run_file in run_files]
+        last_hash = None
+        try:
+            with open(out_file,'ab') as f:
+                for record in heapq.merge(*files):
+                    line_hash,line = record.split(b'\t',1)
+                    if line_hash==last_hash:
+                        self.duplicates[result_file] = self.duplicates.get(result_file,0)+1
+                        continue
+                    last_hash = line_hash
+                    f.write(record if keep_hash else line)
+        finally:
+            for run_file in files:
+                run_file.close()
+        for run_file in run_files:
+            os.remove(run_file)
+
+    def flush_all(self):
+        '''
+        Write the buffers of all result files, in the memory-bounded deduplication the new lines in memory are appended to the journals
+        '''
+        for result_file in list(self.buffers.keys()):
+            self.flush_file(result_file)
+        if self.dedup_memory is not None:
+            for result_file in self.seen:
+                self.write_journal(result_file)
+
+    def flush_file(self,result_file):
+        '''
+        Write the buffer of a result file as one block
+
+        Args:
+            result_file (String): The path of the result file
+        '''
+        with metrics.stage('write'):
+            f = self.files.get(result_file)
+            if f is None:
+                if len(self.files)>=self.max_open_files:
+                    self.files.popitem(last=False)[1].close()
+                f = open(result_file,'ab')
+                self.files[result_file] = f
+            else:
+                self.files.move_to_end(result_file)
+            f.write(b''.join(self.buffers.pop(result_file)))
+            self.buffered -= self.buffer_sizes.pop(result_file)
+
 ##Functions for text file output###############################        
 
 def create_result_folder(domain):
@@ -103,14 +1152,14 @@ def create_result_folder(domain):
         dir_path=''
         for l in range(i):
             dir_path +=('/'+domain_lst[l])
-        if not os.path.exists('results/'+dir_path):
-            os.mkdir('results/'+dir_path)
+        if not os.path.exists(output_dir+'results/'+dir_path):
+            os.mkdir(output_dir+'results/'+dir_path)
     if '.txt' in domain:
-        if not os.path.exists('results/'+domain[:4]):
-            os.mkdir('results/'+domain[:-4])
+        if not os.path.exists(output_dir+'results/'+domain[:-4]):
+            os.mkdir(output_dir+'results/'+domain[:-4])
     else:
-        if not os.path.exists('results/'+domain):
-            os.mkdir('results/'+domain)
+        if not os.path.exists(output_dir+'results/'+domain):
+            os.mkdir(output_dir+'results/'+domain)
 
 def create_all_results_folders(file_paths):
     '''
@@ -124,76 +1173,73 @@ def create_all_results_folders(file_paths):
         void
 
     '''
-    if not os.path.exists('results'):
-        os.mkdir('results')
+    if not os.path.exists(output_dir+'results'):
+        os.mkdir(output_dir+'results')
     for file in file_paths:
-        file_name = file.split('/'+domains_folder_name+'/',1)[1]
+        file_name = file.split(domains_folder_name+'/',1)[1]
         create_result_folder(file_name)
-    with open('results/other.txt','w+') as f:
-        f.write('')
+    if not os.path.isfile(output_dir+'results/other.txt'):
+        with open(output_dir+'results/other.txt','w+') as f:
+            f.write('')
 
-def check_emails_in_domain_txt(file,dict_key):
+def result_folder(file_name):
     '''
-    Check for each email if its domain is in this file, only used for when the output file should be a txt file
+    Get the folder in the results folder that belongs to a domain file of the Domainlist
 
     Args:
-        file   (String): The file path from current directory
-        dict_key (dict): A dictionary with the list of all emails in the input data file(s) as keys 
-                         and the list of all information about each data point (i.e. [email, password, ...]) as values.
-    
+        file_name (String): The path of the domain file inside the Domainlist folder
+
     Returns:
-        new_lst (list): List of all emails that were found in the Domainlist
+        folder (String): The path of the folder in the results folder
 
     '''
-    emails=list(dict_key.keys())
-    lst=[]
-    with open(file) as f:
-        file_name = file.split('/'+domains_folder_name+'/',1)[1]
-        lines = f.readlines()
-        for i in range(len(lines)):
-            line=lines[i].strip()
-            if not line:
-                continue
-            lst.extend([[email,line] for email in emails if line in email])
-            
-    new_lst=[[email[0],email[1]] for email in lst if ((('@'+email[1]) in email[0]) or (('.'+email[1]) in email[0]))]
-    lst=[email[0] for email in new_lst]
-    print()
-    print('All emails in domain file: ',file_name)
-    print(lst)
-    print('------------------------------------')
-    print()
-    infos = [', '.join(list(filter(None,dict_key[email]))) for email in lst]
     if '.txt' in file_name:
-        for i in range(len(lst)):
-            try:
-                with open('results/'+file_name[:-4]+'/'+lst[i].split('@')[1],'a') as f:
-                    f.write(infos[i]+'\n')
-            except:
-                with open('results/'+file_name[:-4]+'/'+lst[i].split('@')[1],'w+') as f:
-                    f.write('\n'.join(infos)+'\n')
-    else:
-        for i in range(len(lst)):
-            try:
-                with open('results/'+file_name+'/'+lst[i].split('@')[1],'a') as f:
-                    f.write(infos[i]+'\n')
-            except:
-                with open('results/'+file_name+'/'+lst[i].split('@')[1],'w+') as f:
-                    f.write('\n'.join(infos)+'\n')
-    return lst
+        return output_dir+'results/'+file_name[:-4]
+    return output_dir+'results/'+file_name
 
-
-result_list = []
-def log_result(result):
+def check_emails_in_domain_txt(emails,offset):
     '''
-    Append the return values of check_emails_in_domain_[txt|other](args) to result_list.
-    (Comment regarding multi-processing: result_list is modified only by the main process, not the pool workers.)
+    Check for each email if its domain is in the Domainlist, only used for when the output file should be a txt file.
+    The emails that are not in the Domainlist are collected in the same pass (they are written to other.txt).
 
     Args:
-        result (list): List of all emails that were found in the Domainlist by check_emails_in_domain_[txt|other]
+        emails (list): List of emails from the input data file(s)
+        offset (int): The position of the first email in the list of all emails
     
+    Returns:
+        matches   (list): List of (position of the email, result file) for all emails that were found in the Domainlist
+        unmatched (list): List of the positions of all emails that were not found in the Domainlist
+
+    '''
+    matches = []
+    unmatched = []
+    for i in range(len(emails)):
+        email = emails[i]
+        file_names = lookup_domain(email,domain_index)
+        if not file_names:
+            unmatched.append(offset+i)
+        for file_name in file_names:
+            matches.append((offset+i,result_folder(file_name)+'/'+email.split('@')[1]))
+    return matches,unmatched
+
+def write_matches_txt(matches,dict_key):
+    '''
+    Write the information of all matched emails to the txt file of their domain in the results folder.
+    The lines are grouped by result file and put into the queue of the result writer.
+
+    Args:
+        matches (list): List of (position of the email, result file) (generated by check_emails_in_domain_txt)
+        dict_key (RecordStore): The store with all data points of the input data file
+
+    Returns:
+        void
+
     '''
-    result_list.append(result)
+    dict_results = {}
+    for i,result_file in matches:
+        dict_results.setdefault(result_file,[]).append(dict_key.line_view(i))
+    for result_file,lines in dict_results.items():
+        result_writer.write(result_file,lines)
 
 def find_email_domains_txt(dict_key,mult_files):
     '''
@@ -202,45 +1248,50 @@ def find_email_domains_txt(dict_key,mult_files):
     i.e. info@vgem-betzenstein.bayern.de (and its additional information) should be written to bayern.txt in the subfolder Bundeslaender in the folder results.
 
     Args:
-        dict_key (dict): A dictionary with the list of all emails in the input data file(s) as keys 
-                         and the list of all information about each data point (i.e. [email, password, ...]) as values.
+        dict_key (RecordStore): The store with all emails in the input data file(s) as keys 
+                                and all information about each data point (i.e. 'email, password, ...') as values.
         mult_files (boolean): Signals whether the input was a folder or a single file
     Returns:
         void
     '''
-    #reset global result_list
-    global result_list
-    result_list=[]
-
-    emails=list(dict_key.keys())
-    infos=list(dict_key.values())
+    emails=dict_key.keys()
     start = time.time()
     #Create results directory
-    dirName = 'results'
+    dirName = output_dir+'results'
     try:
         os.mkdir(dirName)
     except FileExistsError:
         pass
-    #find all text files with domain names
-    file_paths = get_paths(os.path.abspath(os.getcwd())+'/'+domains_folder_name,False)
 
-    #classify each email address
+    #classify each email address by looking up the suffixes of its host in the domain index
     print()
     print('************************************************')
-    print('Start of multiprocessing to find email domains. ')
-    num_workers = mp.cpu_count()
-    print('Number of parallel cores used for multiprocessing: ',num_workers)
-    print('The progressbar shows how many domain files have been processed.')
-    print()
-    pool = mp.Pool(num_workers)
-    jobs=[pool.apply_async(check_emails_in_domain_txt,args=(file_paths[i],dict_key),callback = log_result) for i in range(len(file_paths))]
-    pool.close()
-    result_list_tqdm=[]
-    for job in tqdm(jobs):
-        result_list_tqdm.append(job.get())
-    
-    pool.join()
-    bundes_domain_list = [item for sublist in result_list for item in sublist]
+    print('Start of finding email domains. ')
+    shards = get_shards(emails)
+    with metrics.stage('match'):
+        if worker_pool is None or len(shards)<=1:
+            matches,unmatched,worker,seconds = match_shard(emails,0)
+            metrics.add_worker_time(worker,seconds,len(emails))
+        else:
+            print('The emails are split into ',len(shards),' shards, the progressbar shows how many shards have been processed.')
+            jobs=[(worker_pool.apply_async(match_shard,args=(emails[start:end],start)),end-start) for start,end in shards]
+            matches = []
+            unmatched = []
+            for job,num in tqdm(jobs):
+                shard_matches,shard_unmatched,worker,seconds = job.get()
+                matches.extend(shard_matches)
+                unmatched.extend(shard_unmatched)
+                metrics.add_worker_time(worker,seconds,num)
+    write_matches_txt(matches,dict_key)
+    dict_found = {}
+    for i,result_file in matches:
+        dict_found.setdefault(result_file.rsplit('/',1)[0],[]).append(emails[i])
+    for folder,lst in dict_found.items():
+        print('Emails in domain file ',folder[len(output_dir+'results/'):],': ',len(lst))
+        if debug:
+            print(lst)
+            print('------------------------------------')
+            print()
     end = time.time()
 
     diff = end-start
@@ -250,82 +1301,307 @@ def find_email_domains_txt(dict_key,mult_files):
     diff-=mins*60
     sec = int(diff)
     print("The process has finished in ",hrs," hours ",mins," minutes ", sec,"seconds.")
-    print('End of multiprocessing to find email domains. ')
+    print('End of finding email domains. ')
     print('************************************************')
     print()
     #all unclassified email addresses are put into 'other.txt'
-    with open('results/other.txt','a') as f:
-        for i in range(len(emails)):
-            if emails[i] not in bundes_domain_list:
-                f.write(', '.join(list(filter(None,infos[i])))+'\n')
+    result_writer.write(output_dir+'results/other.txt',[dict_key.line_view(i) for i in unmatched])
 
 ##Functions for csv/excel file output###############################   
-def check_emails_in_domain_other(file,df,dict_key,file_name):
+def check_emails_in_domain_other(emails):
     '''
-    Check for each email if its domain is in this file, only used for when the output file should be a csv/excel file
+    Check for each email if its domain is in the Domainlist, only used for when the output file should be a csv/excel/parquet file.
+    The suffixes of each host are looked up in the domain index (see lookup_domain), each host is only looked up once.
+    The longest suffix wins, if it is in several domain files the first one is taken.
 
     Args:
-        file (String): The file path from current directory
-        df (pandas.Dataframe): Pandas dataframe object with len(lines)) rows containing all the information from the input data 
-                               and following columns: ['email', 'password','ip','url','phone_number','else','domain']
-        dict_key (dict): A dictionary with the key as key and the index in the dataframe as value (generated by get_words_with_label)
-        file_name (String): The name of the file
+        emails (pandas.Series): The column 'email' of the dataframe
     
     Returns:
-        lst (list): List of all emails that were found in the Domainlist
+        domains (pandas.Series): The name of the domain file of each email, 'other' if the domain is not in the Domainlist
 
     '''
-    emails = df['email'].to_list()
-    lst = []
-    with open(file) as f:
-        lines = f.readlines()
-    for line in lines:
-        line = line.strip()
-        if not line:
+    found = {}
+    domains = []
+    for email in emails:
+        if not isinstance(email,str):
+            domains.append('other')
             continue
-        lst.extend([[email,line,dict_key[email],file_name] for email in emails if line in email])
-    new_lst=[[email[0],email[2],email[3]] for email in lst if ((('@'+email[1]) in email[0]) or (('.'+email[1]) in email[0]))]
-    lst = [(email[1],email[2])for email in new_lst]
-    
-    print()
-    print('All emails in domain file: ',file_name)
-    print()
-    print([email[0] for email in new_lst])
-    print()
-    print('--------------------')
-    print()
-    return lst
+        host = email.rsplit('@',1)[-1].lower()
+        domain = found.get(host)
+        if domain is None:
+            file_names = lookup_domain(host,domain_index)
+            domain = file_names[0].split('/')[-1] if file_names else 'other'
+            found[host] = domain
+        domains.append(domain)
+    return pd.Series(domains,index=emails.index,dtype=object)
+
+class ExcelResultWriter:
+    '''
+    Writer for the results.xlsx file. One write-only (streaming) workbook is kept open for the whole run, 
+    the rows of each chunk are appended to the sheet of their domain file, so the workbook never has to be read again.
+    If a sheet reaches the row limit of excel, the workbook is saved and the following rows are written to a new file (results_2.xlsx, results_3.xlsx, ...).
+    A write-only workbook can only be saved once, so the processed chunks are only noted in the checkpoint manifest when their workbook is saved 
+    (i.e. --resume continues after the last saved workbook).
+    '''
 
-def append_df_to_excel(file_names,df,results_file_xlsx):
+    def __init__(self,results_file_xlsx,sheet_names,max_rows=1048576):
+        '''
+        Open the first workbook, files of a previous run are not overwritten (i.e. with --resume the new rows are written to a new file)
+
+        Args:
+            results_file_xlsx (String): The path (including the name) of the first excel file
+            sheet_names       (list): The names of the sheets, i.e. all the file names that are in the Domainlist and 'other'
+            max_rows          (int): The maximal number of rows in one sheet (including the header)
+        '''
+        self.results_file_xlsx = results_file_xlsx
+        self.sheet_names = sheet_names
+        self.max_rows = max_rows
+        self.number = 1
+        self.file_names = []
+        self.pending_chunks = []
+        self.open_workbook()
+
+    def open_workbook(self):
+        '''
+        Open a new write-only workbook with one sheet per domain file, each sheet starts with the column names
+        '''
+        try:
+            from openpyxl import Workbook
+        except ImportError as error:
+            error_output("when writing the xlsx file, please install openpyxl", error, 1)
+        name,ending = os.path.splitext(self.results_file_xlsx)
+        while True:
+            file_name = self.results_file_xlsx if self.number==1 else name+'_'+str(self.number)+ending
+            if not os.path.isfile(file_name):
+                break
+            self.number += 1
+        self.file_name = file_name
+        self.file_names.append(file_name)
+        self.workbook = Workbook(write_only=True)
+        self.sheets = {}
+        self.rows = {}
+        for sheet_name in self.sheet_names:
+            #the title of a sheet can have at most 31 characters
+            self.sheets[sheet_name] = self.workbook.create_sheet(title=sheet_name[:31])
+            self.sheets[sheet_name].append([None]+columns)
+            self.rows[sheet_name] = 1
+
+    def write(self,df):
+        '''
+        Append the rows of a dataframe to the sheets of their domain
+
+        Args:
+            df (pandas.Dataframe): Pandas dataframe object containing all the information from the input data 
+                                   and following columns: ['email', 'password','ip','url','phone_number','else','domain']
+        '''
+        for sheet_name,group in df.groupby('domain',sort=False):
+            if sheet_name not in self.sheets:
+                sheet_name = 'other'
+            for row in group[columns].itertuples(name=None):
+                if self.rows[sheet_name]>=self.max_rows:
+                    self.roll_over()
+                self.sheets[sheet_name].append([None if pd.isna(value) else value for value in row])
+                self.rows[sheet_name] += 1
+
+    def chunk_done(self,file,start,end):
+        '''
+        Remember a chunk of an input file whose rows have all been appended, it is noted in the checkpoint manifest when the workbook is saved
+
+        Args:
+            file  (String): The file path of the input file
+            start (int): The byte position where the chunk starts
+            end   (int): The byte position where the chunk ends
+        '''
+        self.pending_chunks.append((file,start,end))
+
+    def save(self):
+        '''
+        Save the current workbook and note the chunks whose rows are in the saved files in the checkpoint manifest
+        '''
+        self.workbook.save(self.file_name)
+        for chunk in self.pending_chunks:
+            note_chunk_done(*chunk)
+        self.pending_chunks = []
+
+    def roll_over(self):
+        '''
+        Save the current workbook and continue in a new file
+        '''
+        print('The row limit of excel was reached in ',self.file_name,', the following rows are written to a new file.')
+        self.save()
+        self.number += 1
+        self.open_workbook()
+
+    def close(self):
+        '''
+        Save the current workbook
+
+        Returns:
+            file_names (list): All excel files that were written
+        '''
+        self.save()
+        print('The results were written to: ',self.file_names)
+        return self.file_names
+
+
+class ParquetResultWriter:
+    '''
+    Writer for the results.parquet dataset. The dataset is partitioned by the domain file (results.parquet/domain=<domain file>/part-<number>.parquet),
+    one parquet writer per partition is kept open and the rows of each chunk are written as a new row group.
+    A parquet file can only be read when it is closed, so the files are written under a hidden temporary name (.part-<number>.parquet.tmp, 
+    ignored when the dataset is read) and are closed and renamed after at least commit_rows rows. Only then the processed chunks are noted in the checkpoint manifest.
+    The domain column is not stored in the files but in the names of the partitions, 
+    when the dataset is read (i.e. pandas.read_parquet('results.parquet')) it is a dictionary encoded (categorical) column.
     '''
-    Append the contents of a dataframe to an excel file
 
-    Args:
-        file_names (list): All the file names that are in the Domainlist
-        df (pandas.Dataframe): Pandas dataframe object with len(lines)) rows containing all the information from the input data 
-                               and following columns: ['email', 'password','ip','url','phone_number','else','domain']
-        results_file_xlsx (String): The path (including the name) of the excel file to append the contents of the df to
-    
-    Returns:
-        void
+    def __init__(self,results_folder,commit_rows=1000000):
+        '''
+        Prepare the schema of the parquet files, the files of a previous run are not overwritten (i.e. with --resume new files are added to the partitions),
+        unfinished files of an interrupted run are deleted
 
+        Args:
+            results_folder (String): The path (including the name) of the folder of the dataset
+            commit_rows    (int): The number of rows after which the open files are closed and the processed chunks are noted in the checkpoint manifest
+        '''
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as error:
+            error_output("when writing the parquet files, please install pyarrow", error, 1)
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.results_folder = results_folder
+        self.schema = pyarrow.schema([(column,pyarrow.string()) for column in columns if column!='domain'])
+        self.commit_rows = commit_rows
+        self.writers = {}
+        self.file_names = {}
+        self.rows = {}
+        self.uncommitted_rows = 0
+        self.pending_chunks = []
+        if os.path.isdir(results_folder):
+            for partition in os.listdir(results_folder):
+                if not os.path.isdir(results_folder+'/'+partition):
+                    continue
+                for file in os.listdir(results_folder+'/'+partition):
+                    if file.startswith('.part-') and file.endswith('.tmp'):
+                        os.remove(results_folder+'/'+partition+'/'+file)
+
+    def write(self,df):
+        '''
+        Write the rows of a dataframe as a row group to the partition of their domain
+
+        Args:
+            df (pandas.Dataframe): Pandas dataframe object containing all the information from the input data 
+                                   and following columns: ['email', 'password','ip','url','phone_number','else','domain']
+        '''
+        for domain,group in df.groupby('domain',sort=False):
+            writer = self.writers.get(domain)
+            if writer is None:
+                writer = self.open_partition(domain)
+            table = self.pa.Table.from_pandas(group[self.schema.names],schema=self.schema,preserve_index=False)
+            writer.write_table(table)
+            self.rows[domain] += len(group)
+        self.uncommitted_rows += len(df)
+
+    def open_partition(self,domain):
+        '''
+        Open a new parquet file in the partition of a domain
+
+        Args:
+            domain (String): The name of the domain file (or 'other')
+
+        Returns:
+            writer (pyarrow.parquet.ParquetWriter): The writer of the new file
+        '''
+        partition = self.results_folder+'/domain='+domain
+        if not os.path.exists(partition):
+            os.makedirs(partition)
+        number = 0
+        while os.path.isfile(partition+'/part-'+str(number)+'.parquet'):
+            number += 1
+        writer = self.pq.ParquetWriter(partition+'/.part-'+str(number)+'.parquet.tmp',self.schema,use_dictionary=True,compression='snappy')
+        self.writers[domain] = writer
+        self.file_names[domain] = partition+'/part-'+str(number)+'.parquet'
+        self.rows.setdefault(domain,0)
+        return writer
+
+    def chunk_done(self,file,start,end):
+        '''
+        Remember a chunk of an input file whose rows have all been written, the open files are committed if they have reached commit_rows rows
+
+        Args:
+            file  (String): The file path of the input file
+            start (int): The byte position where the chunk starts
+            end   (int): The byte position where the chunk ends
+        '''
+        self.pending_chunks.append((file,start,end))
+        if self.uncommitted_rows>=self.commit_rows:
+            self.commit()
+
+    def commit(self):
+        '''
+        Close the open parquet files, give them their final name and note the chunks whose rows are in these files in the checkpoint manifest
+        '''
+        for domain,writer in self.writers.items():
+            writer.close()
+            os.replace(writer.where,self.file_names[domain])
+        self.writers = {}
+        self.uncommitted_rows = 0
+        for chunk in self.pending_chunks:
+            note_chunk_done(*chunk)
+        self.pending_chunks = []
+
+    def close(self):
+        '''
+        Close the parquet files of all partitions
+
+        Returns:
+            rows (dict): A dictionary with the domain as key and the number of written rows as value
+        '''
+        self.commit()
+        print('The results were written to ',self.results_folder,': ')
+        for domain,num in self.rows.items():
+            print(domain,': ',num,' rows')
+        return self.rows
+
+class CsvResultWriter:
+    '''
+    Writer for the results.csv file. The rows of each chunk are appended to the file, 
+    the column names are only written when the file is created (i.e. with --resume the rows are appended to the file of the previous run).
     '''
-    xlsx = pd.ExcelFile(results_file_xlsx)
-    df_dict={}
-    for sheet_name in xlsx.sheet_names:
-        df_dict[sheet_name]=pd.read_excel(xlsx,sheet_name,index_col=0)
-    with pd.ExcelWriter(results_file_xlsx) as writer:  
-        for file in file_names:
-            try:
-                concat_df = pd.concat([df_dict[file],df[df['domain']==file]])
-                concat_df.to_excel(writer,sheet_name=file)
-            except:
-                pass
-        concat_df = pd.concat([df_dict['other'],df[df['domain']=='other']])
-        concat_df.to_excel(writer,sheet_name='other')    
-
 
-def find_email_domains_other(df,dict_key,mult_files,results_file_xlsx,out_format):
+    def __init__(self,results_file):
+        '''
+        Args:
+            results_file (String): The path (including the name) of the csv file
+        '''
+        self.results_file = results_file
+        self.rows = 0
+
+    def write(self,df):
+        '''
+        Append the rows of a dataframe to the csv file
+
+        Args:
+            df (pandas.Dataframe): Pandas dataframe object containing all the information from the input data 
+                                   and following columns: ['email', 'password','ip','url','phone_number','else','domain']
+        '''
+        if not os.path.isfile(self.results_file):
+            df.to_csv(self.results_file,header='column_names')
+        else:
+            df.to_csv(self.results_file,mode='a', header=False)
+        self.rows += len(df)
+
+    def close(self):
+        '''
+        Returns:
+            rows (int): The number of written rows
+        '''
+        print('The results were written to ',self.results_file,': ',self.rows,' rows')
+        return self.rows
+
+def find_email_domains_other(df,dict_key,mult_files,results_file,out_format):
     '''
     Find all emails, where the domain is in Domainlist. 
     Write the email addresses to the specific sheet in the results.[xlsx|csv] to which its domain belongs to.
@@ -336,233 +1612,814 @@ def find_email_domains_other(df,dict_key,mult_files,results_file_xlsx,out_format
                                and following columns: ['email', 'password','ip','url','phone_number','else','domain']
         dict_key (dict): A dictionary with the key as key and the index in the dataframe as value (generated by get_words_with_label)
         mult_files (boolean): Signals whether the input was a folder or a single file
-        results_file_xlsx (String): The path (including the name) of the excel file to append or write the contents of the df to
+        results_file (String): The path (including the name) of the result file, the rows are written by the writer of the output format
         out_format (String): The user-specified output format
     
     Returns:
         void
     '''
     start = time.time()
-    print('Start of multiprocessing to find email domains. ')
-    #find all text files with domain names
-    #file_paths, file_names = get_paths(os.path.abspath(os.getcwd())+'/Domainchecker-master-Domainlisten',True)
-    file_paths, file_names = get_paths(os.path.abspath(os.getcwd())+'/'+domains_folder_name,True)
-    #classify each email address
-    num_workers = mp.cpu_count()
-    print()
-    print('Number of parallel cores: ',num_workers)
-    pool = mp.Pool(num_workers)
-    for i in range(len(file_paths)):
-        pool.apply_async(check_emails_in_domain_other,args=(file_paths[i],df,dict_key,file_names[i]),callback = log_result)
-    pool.close()
-    pool.join()
-    #bundes_domain_list := dict of all emails that are in the domain list with the value domain name
-    bundes_domain_list = [item for sublist in result_list for item in sublist]
-    for element in bundes_domain_list:
-        df.loc[element[0],'domain'] = element[1]
+    print('Start of finding email domains. ')
+    #classify all email addresses by looking up the suffixes of their hosts in the domain index
+    with metrics.stage('match'):
+        df['domain'] = check_emails_in_domain_other(df['email'])
+    for file_name,emails in df[df['domain']!='other'].groupby('domain')['email']:
+        print('Emails in domain file ',file_name,': ',len(emails))
+        if debug:
+            print(emails.to_list())
+            print('--------------------')
+            print()
     #write results to excel file
-    if out_format=='.xlsx':
-        if ((mult_files==False) or (not os.path.isfile(results_file_xlsx))):
-            with pd.ExcelWriter(results_file_xlsx) as writer:  
-                for file in file_names:
-                    try:
-                        df[df['domain']==file].to_excel(writer,sheet_name=file)
-                    except:
-                        pass
-                try:
-                    df[df['domain']=='other'].to_excel(writer,sheet_name='other')
-                except:
-                    pass
-        else:
-            append_df_to_excel(file_names,df,results_file_xlsx)
-    else: #out_format=='.csv'
-        if ((mult_files==False) or (not os.path.isfile(results_file_xlsx))):
-            df.to_csv('results.csv',header='column_names')
-        else:
-            df.to_csv('results.csv',mode='a', header=False)
+    with metrics.stage('write'):
+        if out_format=='.xlsx':
+            excel_writer.write(df)
+        elif out_format=='.parquet':
+            parquet_writer.write(df)
+        else: #out_format=='.csv'
+            csv_writer.write(df)
     end = time.time()
     print("The process has finished in ",end-start, "seconds.")
-    print('End of multiprocessing to find email domains. ')
+    print('End of finding email domains. ')
     print()
             
+##Compact store of the data points###############################
+
+class RecordStore:
+    '''
+    Compact store of all data points of an input file with the key as key, if a key occurs multiple times only the last occurence is kept (like a dict).
+    The line of each data point (i.e. 'email, password, ...') is encoded in UTF-8 and appended to one contiguous bytearray (the arena),
+    arrays of offsets and lengths point to the line of each data point in the arena. The line usually starts with the key, then the key is not stored again 
+    and only its length is kept, otherwise (a line with several keys) the key is stored in front of the line.
+    The keys are found with an open-addressing hash table (linear probing), which holds the number of the data point.
+    '''
+
+    def __init__(self,capacity=1024):
+        '''
+        Create an empty store
+
+        Args:
+            capacity (int): The initial number of slots in the hash table (a power of 2)
+        '''
+        self.arena = bytearray()
+        self.starts = array('Q')
+        self.key_lengths = array('I')
+        self.line_lengths = array('I')
+        #1 if the key is the beginning of the line, 0 if the key is stored in front of the line
+        self.in_line = bytearray()
+        self.hashes = array('q')
+        self.table = array('q',[-1])*capacity
+        self.mask = capacity-1
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self,key,line):
+        '''
+        Add a data point to the store, if the key is already in the store its line is replaced
+
+        Args:
+            key  (String): The key of the data point (i.e. the email address)
+            line (String): All information about the data point joined to one String (i.e. 'email, password, ...')
+        '''
+        key_bytes = key.encode('UTF-8',errors='ignore')
+        line_bytes = line.encode('UTF-8',errors='ignore')
+        key_hash = hash(key_bytes)
+        table = self.table
+        mask = self.mask
+        arena = self.arena
+        slot = key_hash & mask
+        record = table[slot]
+        while record!=-1:
+            if self.hashes[record]==key_hash and self.key_lengths[record]==len(key_bytes) and arena.startswith(key_bytes,self.starts[record]):
+                break
+            slot = (slot+1) & mask
+            record = table[slot]
+        #the line is appended to the arena, the key only if the line does not start with it
+        start = len(arena)
+        in_line = line_bytes.startswith(key_bytes)
+        if not in_line:
+            arena += key_bytes
+        arena += line_bytes
+        if record!=-1:
+            #the last occurence of a key wins
+            self.starts[record] = start
+            self.in_line[record] = in_line
+            self.line_lengths[record] = len(line_bytes)
+            return
+        table[slot] = len(self.starts)
+        self.starts.append(start)
+        self.in_line.append(in_line)
+        self.key_lengths.append(len(key_bytes))
+        self.line_lengths.append(len(line_bytes))
+        self.hashes.append(key_hash)
+        if len(self.starts)*10>=len(table)*7:
+            self.grow()
+
+    def grow(self):
+        '''
+        Double the number of slots in the hash table and insert all data points again
+        '''
+        self.table = array('q',[-1])*(len(self.table)*2)
+        self.mask = len(self.table)-1
+        for record in range(len(self.starts)):
+            slot = self.hashes[record] & self.mask
+            while self.table[slot]!=-1:
+                slot = (slot+1) & self.mask
+            self.table[slot] = record
+
+    def finish(self):
+        '''
+        Free the hash table after the last data point was added, afterwards the lines can be used as views without copying them
+        (no data point can be added while a view of the arena exists)
+        '''
+        self.table = None
+        self.hashes = None
+
+    def keys(self):
+        '''
+        Returns:
+            keys (list): The keys of all data points in the order in which they first occured
+        '''
+        arena = self.arena
+        return [arena[start:start+length].decode('UTF-8') for start,length in zip(self.starts,self.key_lengths)]
+
+    def line_view(self,record):
+        '''
+        Get the line of a data point without copying it, only possible after finish()
+
+        Args:
+            record (int): The number of the data point
+
+        Returns:
+            line (memoryview): The UTF-8 encoded line (i.e. 'email, password, ...')
+        '''
+        start = self.starts[record] if self.in_line[record] else self.starts[record]+self.key_lengths[record]
+        return memoryview(self.arena)[start:start+self.line_lengths[record]]
+
+    def line_views(self):
+        '''
+        Returns:
+            lines (list): The lines of all data points without copying them (see line_view)
+        '''
+        return [self.line_view(record) for record in range(len(self.starts))]
+
+##Functions for the non-interactive mode###############################
+
+def ask(question,default):
+    '''
+    Ask the user a question, in the batch mode (--batch) the default answer is taken without asking
+
+    Args:
+        question (String): The question
+        default  (String): The answer that is taken in the batch mode
+
+    Returns:
+        answer (String): The answer of the user
+    '''
+    if batch_mode:
+        print(question+default+' (batch mode)')
+        return default
+    return input(question)
+
+def read_config(config_file):
+    '''
+    Read the options of a run from a config file, so that the same run can be scheduled without typing all options.
+    Each line holds one option as in the command line without the leading '--' (i.e. 'batch', 'key=email', 'workers=4'), empty lines and lines starting with '#' are skipped.
+
+    Args:
+        config_file (String): The path of the config file
+
+    Returns:
+        options (list): The options as command line arguments (i.e. ['--batch','--key=email','--workers=4'])
+    '''
+    try:
+        with open(config_file,'r',encoding='utf-8') as f:
+            lines = [line.strip() for line in f]
+    except OSError as error:
+        error_output("when reading the config file "+config_file, error, 1)
+    return ['--'+line.lstrip('-') for line in lines if line and not line.startswith('#')]
+
+def detect_key(lines,scores=None):
+    '''
+    Detect the key of data points from a sample of the lines with the match rates of the keys per column (see score_keys).
+    The first key in key_preference which is found in one column of at least half of the lines is taken, otherwise the key with the highest match rate.
+
+    Args:
+        lines  (list): The sample of lines, each line is a String
+        scores (dict): The match rates of score_keys, if they were already computed
+
+    Returns:
+        key (String): The detected key
+    '''
+    if scores is None:
+        scores = score_keys(lines)
+    best = {key:max(rates,default=0) for key,rates in scores.items()}
+    for key in key_preference:
+        if best[key]>=0.5:
+            return key
+    return max(key_preference,key=lambda key: best[key])
+
+def choose_fallback_key(lines,key):
+    '''
+    Choose the key if no line of the sample has a word that matches the key, the choice depends on the fallback key policy (--fallback-key):
+    prompt asks the user, keep continues with the key (lines without the key are skipped), auto detects the key from the sample 
+    and a key name (i.e. ip) is taken as the new key.
+
+    Args:
+        lines (list): The sample of lines, each line is a String
+        key   (String): The key that was not found in the sample
+
+    Returns:
+        key (String): The key to continue with
+    '''
+    if fallback_key=='keep':
+        return key
+    if fallback_key=='auto':
+        new_key = detect_key(lines)
+        print('No ',key,' was found in a sample of the lines, the key ',new_key,' was detected from the sample.')
+        return new_key
+    if fallback_key!='prompt':
+        print('No ',key,' was found in a sample of the lines, the fallback key ',fallback_key,' is used.')
+        return fallback_key
+    input_var = ask("No "+key+" was found in a sample of the lines if you want to continue with "+key+" as key enter Y otherwise enter n: ",'Y')
+    if input_var=='Y':
+        return key
+    input_var = ask("Choose a different key from: [password, ip, url, phone_number, else] and input the chosen word in the same spelling here: ",key)
+    print ("you entered " + input_var)
+    return input_var
+
+##Functions for the key and layout detection###############################
+
+def sample_lines(file,sample_size=1000,num_offsets=8):
+    '''
+    Take a sample of the lines of an input file. The lines of a txt file are read at num_offsets evenly spaced byte positions (with seek), 
+    so that the sample covers the whole file without reading it. For csv and excel files and for compressed files the first lines are taken.
+
+    Args:
+        file        (String): The file path from current directory
+        sample_size (int): The maximal number of lines in the sample
+        num_offsets (int): The number of positions in a txt file from where lines are read
+
+    Returns:
+        lines (list): The sample of lines, each line is a String
+    '''
+    in_format = input_format(file)[0]
+    if in_format!='.txt' or is_stream_input(file):
+        if in_format=='.csv':
+            batches = read_csv_batches(file,sample_size*100)
+        elif in_format=='.xlsx':
+            batches = read_xlsx_batches(file,sample_size*100)
+        else:
+            batches = (lines for lines,end in read_line_batches(file,sample_size*100))
+        for lines in batches:
+            return lines[:sample_size]
+        return []
+    size = os.path.getsize(file)
+    lines_per_offset = max(1,sample_size//num_offsets)
+    lines = []
+    end = 0
+    with open(file,'rb') as f:
+        for i in range(num_offsets):
+            offset = size*i//num_offsets
+            if offset<end:
+                #the lines at this position are already in the sample (small file)
+                offset = end
+            f.seek(offset)
+            if offset>0 and offset!=end:
+                #skip the rest of the line in which the position lies
+                f.readline()
+            for _ in range(lines_per_offset):
+                line = f.readline()
+                if not line:
+                    break
+                lines.append(line.decode('UTF-8',errors='ignore'))
+            end = f.tell()
+    return lines
+
+def score_keys(lines):
+    '''
+    Compute the match rate of each key per column position: the share of the lines in which the word at the position matches the regex of the key.
+
+    Args:
+        lines (list): The sample of lines, each line is a String
+
+    Returns:
+        scores (dict): A dictionary with the key as key and a list of the match rates per column position as value
+    '''
+    counts = {key:[] for key in key_preference}
+    for line in lines:
+        words = list(filter(None,[word.strip() for word in re.split(';|,|\n|:| |\t',line)]))
+        for key in key_preference:
+            key_counts = counts[key]
+            for i,word in enumerate(words):
+                if is_key(word,key):
+                    if i>=len(key_counts):
+                        key_counts.extend([0]*(i+1-len(key_counts)))
+                    key_counts[i] += 1
+    num_lines = max(1,len(lines))
+    return {key:[count/num_lines for count in key_counts] for key,key_counts in counts.items()}
+
+def detect_layout(lines,key,scores,min_share=0.95):
+    '''
+    Detect if the lines of the sample have a uniform layout: the same number of columns separated by one delimiter and the key always in the same column.
+    With a uniform layout the lines can be split with a plain str.split instead of the regex (see split_positional), 
+    the lines that do not have the layout are still split with the regex.
+
+    Args:
+        lines     (list): The sample of lines, each line is a String
+        key       (String): The key of the data points
+        scores    (dict): The match rates of score_keys
+        min_share (float): The minimal share of the lines that have to have the layout
+
+    Returns:
+        layout (dict): The delimiter, the number of columns, the column of the key and the regex of the other delimiters, None if the layout is not uniform
+    '''
+    rates = scores.get(key,[])
+    lines = [line.rstrip('\r\n') for line in lines]
+    if not rates or not lines:
+        return None
+    position = max(range(len(rates)),key=lambda i: rates[i])
+    #an email is only taken from its column if it is the only '@' in the line, other keys must not be found in another column of the sample
+    if rates[position]<min_share or (key!='email' and sum(rates)>rates[position]):
+        return None
+    for delimiter in ':;,\t ':
+        if delimiter in ' \t':
+            other_delimiters = re.compile('[;,:]|[^\\S'+delimiter+']')
+        else:
+            other_delimiters = re.compile('['+';,:'.replace(delimiter,'')+']|\\s')
+        num_columns = {}
+        for line in lines:
+            words = line.split(delimiter)
+            if '' not in words and other_delimiters.search(line) is None:
+                num_columns[len(words)] = num_columns.get(len(words),0)+1
+        if num_columns:
+            columns_count = max(num_columns,key=num_columns.get)
+            if columns_count>position and num_columns[columns_count]>=min_share*len(lines):
+                return {'delimiter':delimiter,'columns':columns_count,'key_position':position,'other_delimiters':other_delimiters}
+    return None
+
+def split_positional(line,layout,key):
+    '''
+    Split a line with the uniform layout of the input file (see detect_layout).
+
+    Args:
+        line   (String): The line
+        layout (dict): The layout of detect_layout
+        key    (String): The key of the data points
+
+    Returns:
+        words (list): The words of the line, None if the line does not have the layout (then the line is split with the regex)
+    '''
+    line = line.rstrip('\n')
+    words = line.split(layout['delimiter'])
+    if len(words)!=layout['columns'] or '' in words or layout['other_delimiters'].search(line) is not None:
+        return None
+    if not is_key(words[layout['key_position']],key) or (key=='email' and line.count('@')!=1):
+        return None
+    return words
+
+def detect_input(file,key):
+    '''
+    Detect the key and the layout of an input file from a sample of its lines, once before the file is read. 
+    If no line of the sample has the key, the key is chosen with the fallback key policy (see choose_fallback_key).
+
+    Args:
+        file (String): The file path from current directory
+        key  (String): The key given by the user (standard:email) to sort by, i.e. most important information
+
+    Returns:
+        key    (String): The key for the file
+        layout (dict): The layout of detect_layout, None if the layout is not uniform
+    '''
+    with metrics.stage('detect'):
+        lines = sample_lines(file)
+        scores = score_keys(lines)
+    if lines and max(scores.get(key,[]),default=0)==0:
+        key = choose_fallback_key(lines,key)
+    with metrics.stage('detect'):
+        layout = detect_layout(lines,key,scores) if key in scores else None
+    if layout is not None:
+        print('The lines of the sample have ',layout['columns'],' columns separated by ',repr(layout['delimiter']),', the ',key,' is in column ',layout['key_position']+1,'.')
+    return key,layout
+
 ##################################################################################
 ##Two functions that handle input from txt files as lines##
-def get_words_without_label(lines,key):
+def get_words_without_label(lines,key,layout=None):
     '''
     Find the key in each line of the file. If a key occurs multiple times then only the last occurence is taken into account.
     Does not label the other information given in each data point, but puts each word into a list of all words in the line.
+    With a uniform layout (see detect_layout) the lines are split at the delimiter and only the key column is checked.
 
     Args:
         lines (list): The list of Strings from the txt file, each line is a String
         key (String): The key given by the user (standard:email) to sort by, i.e. most important information
+        layout (dict): The layout of the input file, None if it is not uniform
 
     Returns:
-        dict_key (dict): A dictionary with the key as key and the whole data point as a list (i.e. [email,password,...]) as value
+        dict_key (RecordStore): A compact store with the key as key and the whole data point as one line (i.e. 'email, password, ...') as value
 
     '''
-    dict_key = {}
-    index=0
+    dict_key = RecordStore()
     for line in lines:
+        if layout is not None:
+            words = split_positional(line,layout,key)
+            if words is not None:
+                position = layout['key_position']
+                key_word = words[position]
+                if censor_password==True:
+                    for i,word in enumerate(words):
+                        if i!=position and compiled_regex['password'].fullmatch(word):
+                            words[i] = word[:3]+'****'
+                words[0],words[position] = words[position],words[0]
+                dict_key.add(key_word,', '.join(words))
+                continue
         lst = re.split(';|,|\n|:| |\t',line)
         words = list(filter(None,[word.strip() for word in lst]))
-        email_exists = False
+        key_words = []
         for i in range(len(words)):
             word=words[i]
-            if is_something(dict_regex[key],word):
-                email_exists=True
+            if is_key(word,key):
                 if i!=0:
                     words[0],words[i] = words[i], words[0]
-                dict_key[word]=words
+                key_words.append(word)
                 continue
             if censor_password==True:
-                if is_something(dict_regex['password'],word):
+                if compiled_regex['password'].fullmatch(word):
                     words[i] = word[:3]+'****'
-        if ((email_exists==False) and (index==0)):
-            input_var=input("No email was found in the first line if you want to continue with email as key enter Y otherwise enter n: ")
-            if input_var=='Y':
-                continue
-            input_var = input("Choose a different key from: [password, ip, url, phone_number, else] and input the chosen word in the same spelling here: ")
-            print ("you entered " + input_var)
-            get_words_without_label(lines,input_var)
+        #all keys of a line share the same data point
         #Note those without a key (email address) as in the other lines won't be considered
-        index+=1  
+        for word in key_words:
+            dict_key.add(word,', '.join(words))
+    dict_key.finish()
     return dict_key
 
-def label(df,index,key,dict_key,word,words,i,multiple_occur,keep_index,email_exists,recur):
+def get_words_with_label(lines,key,layout=None):
     '''
-    Label the information in each line of the input file.
+    Find the key in each line of the file. If a key occurs multiple times then all information is stored in one row seperated with ', '
+    Also labels the other information given in each data point and puts each word into a list of all words in the line.
+    The information is collected in one list per column and the dataframe is only created at the end.
+    With a uniform layout (see detect_layout) the lines are split at the delimiter and the key is taken from its column.
 
     Args:
-        df (pandas.Dataframe): Pandas dataframe object with len(lines)) rows containing all the information from the input data 
-                               and following columns: ['email', 'password','ip','url','phone_number','else','domain']
-        index (int): position of the email address in the dataframe
+        lines (list): The list of Strings from the txt file, each line is a String
         key (String): The key given by the user (standard:email) to sort by, i.e. most important information
-        dict_key (dict): A dictionary with the key as key and the whole data point as a list (i.e. [email,password,...]) as value
-        word (String): One information that is being labeled, this could be an email address, password etc.
-        words (String): All other words (infos) that were given in the same line in the input file
-        i (int): word position in words
-        multiple_occur (boolean): True if an email is already in the dataframe, else False
-        keep_index (int): row position in the dataframe, from where all rows below are still empty
-        email_exists (boolean): True if email exists in the line, else False
-        recur (int): an integer to check if an infinite recursion loop has been started
+        layout (dict): The layout of the input file, None if it is not uniform
 
     Returns:
-        multiple_occur (boolean): True if an email is already in the dataframe, else False
-        keep_index (int): row position in the dataframe, from where all rows below are still empty
-        index (int): position of the email address in the dataframe
-        email_exists (boolean): True if email exists in the line, else False
-
+        dict_key (dict): A dictionary with the key as key and the index in the dataframe as value
+        df (pandas.Dataframe): Pandas dataframe object with one row per key and following columns: ['email', 'password','ip','url','phone_number','else','domain']
+        
     '''
-
-    if recur>=2:
-        print('Label: ',index,key,words,word)
-        if df.loc[index,'password']=='':
-            df.loc[index,'password'] = word
-        else:
-            df.loc[index,'password'] = df.loc[index,'password']+', '+word
-        print(df.loc[index])
-        return multiple_occur,keep_index,index,email_exists
-    if (is_something(dict_regex[key],word) and recur<2 and email_exists==False):
-        if word in dict_key.keys():
-            email_exists=True
-            df.loc[index] = ['','','','','','','other']
-            multiple_occur=True
-            keep_index=index
-            index=dict_key[word]
-            for w in words[:i]:
-                label(df,index,key,dict_key,w,words,i,multiple_occur,keep_index,email_exists,recur+1)
+    dict_key = {}
+    dict_columns = {column:[] for column in columns}
+    for line in lines:
+        words = split_positional(line,layout,key) if layout is not None else None
+        if words is not None:
+            key_word = words.pop(layout['key_position'])
         else:
-            email_exists=True
-            dict_key[word]=index
-            df.loc[index,key] = word 
-    elif is_something(dict_regex['ip'],word):
-        if df.loc[index,'ip']=='':
-            df.loc[index,'ip'] = word
+            lst = re.split(';|,|\n|:| |\t',line)
+            words =[word.strip() for word in lst]
+            words = list(filter(None,words))
+            key_word = None
+        dict_row = {}
+        for word in words:
+            word_label = classify_word(word,key if key_word is None else None)
+            if word_label==key and key_word is None:
+                key_word = word
+                continue
+            if word_label=='password' and censor_password==True:
+                word = word[:3]+'****'
+            dict_row.setdefault(word_label,[]).append(word)
+        if key_word is None:#Those without a key (email address) as in the other lines won't be considered
+            continue
+        if key_word in dict_key:
+            #the key occured before, add all information to its row
+            index = dict_key[key_word]
+            for column,values in dict_row.items():
+                if dict_columns[column][index]=='':
+                    dict_columns[column][index] = ', '.join(values)
+                else:
+                    dict_columns[column][index] += ', '+', '.join(values)
         else:
-            df.loc[index,'ip'] = df.loc[index,'ip']+', '+word
+            dict_key[key_word] = len(dict_columns[key])
+            dict_row.setdefault(key,[]).insert(0,key_word)
+            for column in columns[:-1]:
+                dict_columns[column].append(', '.join(dict_row.get(column,[])))
+            dict_columns['domain'].append('other')
+    df = pd.DataFrame(dict_columns,columns=columns)
+    return dict_key,df
 
-    elif is_something(dict_regex['url'],word):
-        if df.loc[index,'url']=='':
-            df.loc[index,'url'] = word
-        else:
-            df.loc[index,'url'] = df.loc[index,'url']+', '+word
+##Functions for compressed inputs and zip files###############################
 
-    elif is_something(dict_regex['phone_number'],word):
-        if df.loc[index,'phone_number']=='':
-            df.loc[index,'phone_number'] = word
-        else:
-            df.loc[index,'phone_number'] = df.loc[index,'url']+', '+word
+def split_zip_member(file):
+    '''
+    Split the path of a member of a zip file (i.e. leaks.zip/2021/leak.txt) into the path of the zip file and the name of the member
 
-    elif is_something(dict_regex['password'],word):
-        if censor_password==True:
-            if df.loc[index,'password']=='':
-                df.loc[index,'password'] = word[:3]+'****'
-            else:
-                df.loc[index,'password'] = (df.loc[index,'password']+', '+word[:3]+'****')
-        else:
-            if df.loc[index,'password']=='':
-                df.loc[index,'password'] = word
-            else:
-                df.loc[index,'password'] = (df.loc[index,'password']+', '+word)
+    Args:
+        file (String): The file path from current directory
+
+    Returns:
+        archive (String): The path of the zip file, None if the file is not a member of a zip file
+        member  (String): The name of the member in the zip file, None if the file is not a member of a zip file
+    '''
+    pos = file.lower().find('.zip/')
+    if pos==-1 or not os.path.isfile(file[:pos+4]):
+        return None,None
+    return file[:pos+4],file[pos+5:]
+
+def input_format(file):
+    '''
+    Get the format of an input file and its compression, i.e. leak.csv.gz is a csv file compressed with gzip. 
+    A compressed file without a known format (i.e. leak.gz) is handled as a txt file.
 
+    Args:
+        file (String): The file path from current directory
+
+    Returns:
+        in_format   (String): The format (.txt, .csv or .xlsx), None if the format is not supported
+        compression (String): The compression (.gz, .bz2, .xz or .zst), None if the file is not compressed
+    '''
+    name,ending = os.path.splitext(file.lower())
+    compression = None
+    if ending in compression_formats:
+        compression = ending
+        name,ending = os.path.splitext(name)
+    if ending in ('.txt','.csv','.xlsx'):
+        return ending,compression
+    if compression is not None:
+        return '.txt',compression
+    return None,None
+
+def is_stream_input(file):
+    '''
+    Check if an input file can only be read as a stream (compressed files and members of zip files), i.e. without seek and byte ranges
+
+    Args:
+        file (String): The file path from current directory
+
+    Returns:
+        boolean: True, if the file is read as a stream, else False
+    '''
+    return input_format(file)[1] is not None or split_zip_member(file)[0] is not None
+
+def input_size(file):
+    '''
+    Get the size of an input file, for a member of a zip file the uncompressed size of the member
+
+    Args:
+        file (String): The file path from current directory
+
+    Returns:
+        size (int): The size in bytes
+    '''
+    archive,member = split_zip_member(file)
+    if archive is None:
+        return os.path.getsize(file)
+    with zipfile.ZipFile(archive) as zip_file:
+        return zip_file.getinfo(member).file_size
+
+def open_input(file):
+    '''
+    Open an input file as a binary stream. Compressed files are decompressed while they are read and the members of a zip file 
+    are read directly from the zip file, so nothing has to be decompressed to the disk first.
+    Files compressed with bgzip (BGZF) are decompressed in parallel (see BgzfReader), gzip files with several members are read member by member.
+
+    Args:
+        file (String): The file path from current directory
+
+    Returns:
+        f (file object): The binary stream of the (decompressed) content
+    '''
+    archive,member = split_zip_member(file)
+    if archive is not None:
+        f = zipfile.ZipFile(archive).open(member)
     else:
-        if df.loc[index,'else']=='':
-            df.loc[index,'else'] = word
-        else:
-            df.loc[index,'else'] = (df.loc[index,'url']+', '+word)
-    return multiple_occur,keep_index,index,email_exists
+        f = open(file,'rb')
+    compression = input_format(file)[1]
+    if compression=='.gz':
+        header = f.peek(18)[:18]
+        #a BGZF block is a gzip member with the extra subfield 'BC', which contains the size of the block
+        if len(header)==18 and header[:2]==b'\x1f\x8b' and header[3]&4 and header[12:14]==b'BC':
+            return io.BufferedReader(BgzfReader(f,max(1,num_workers)),1024*1024)
+        return gzip.GzipFile(fileobj=f)
+    if compression=='.bz2':
+        return bz2.BZ2File(f)
+    if compression=='.xz':
+        return lzma.LZMAFile(f)
+    if compression=='.zst':
+        try:
+            import zstandard
+        except ImportError as error:
+            error_output("when reading the zst file, please install zstandard", error, 1)
+        return zstandard.ZstdDecompressor().stream_reader(f,read_across_frames=True,closefd=True)
+    return f
 
-def get_words_with_label(lines,key,df):
+class BgzfReader(io.RawIOBase):
     '''
-    Find the key in each line of the file. If a key occurs multiple times then all information is stored in one row seperated with ', '
-    Also labels the other information given in each data point and puts each word into a list of all words in the line.
+    Reader for files compressed with bgzip (BGZF). The file consists of independent gzip members (blocks) of at most 64 KB, 
+    the size of each block is in its header, so the blocks can be cut out without decompressing them.
+    The blocks are decompressed in parallel by a pool of threads (zlib releases the GIL) and returned in their order.
+    '''
+
+    def __init__(self,f,threads,blocks_per_task=64):
+        '''
+        Args:
+            f               (file object): The binary stream of the compressed file
+            threads         (int): The number of threads which decompress the blocks
+            blocks_per_task (int): The number of blocks that one thread decompresses at once
+        '''
+        super().__init__()
+        self.f = f
+        self.threads = threads
+        self.blocks_per_task = blocks_per_task
+        self.executor = ThreadPoolExecutor(threads)
+        self.pending = deque()
+        self.buffer = b''
+        self.pos = 0
+        self.eof = False
+
+    def read_blocks(self):
+        '''
+        Cut the next blocks out of the compressed file
+
+        Returns:
+            blocks (list): The compressed blocks (bytes)
+        '''
+        blocks = []
+        while len(blocks)<self.blocks_per_task:
+            header = self.f.read(12)
+            if not header:
+                self.eof = True
+                break
+            extra_length = int.from_bytes(header[10:12],'little')
+            extra = self.f.read(extra_length)
+            block_size = None
+            pos = 0
+            while pos+4<=len(extra):
+                length = int.from_bytes(extra[pos+2:pos+4],'little')
+                if extra[pos:pos+2]==b'BC':
+                    block_size = int.from_bytes(extra[pos+4:pos+6],'little')+1
+                pos += 4+length
+            if header[:2]!=b'\x1f\x8b' or block_size is None:
+                error_output("when reading the BGZF file, a block has no valid header", header, 1)
+            blocks.append(header+extra+self.f.read(block_size-12-extra_length))
+        return blocks
+
+    def fill(self):
+        '''
+        Start the decompression of the next blocks, so that each thread has up to two tasks
+        '''
+        while not self.eof and len(self.pending)<2*self.threads:
+            blocks = self.read_blocks()
+            if blocks:
+                self.pending.append(self.executor.submit(decompress_blocks,blocks))
+
+    def readinto(self,b):
+        '''
+        Read the decompressed content into a buffer
+
+        Args:
+            b (bytearray): The buffer
+
+        Returns:
+            num (int): The number of bytes read, 0 at the end of the file
+        '''
+        while self.pos>=len(self.buffer):
+            self.fill()
+            if not self.pending:
+                return 0
+            self.buffer = self.pending.popleft().result()
+            self.pos = 0
+        num = min(len(b),len(self.buffer)-self.pos)
+        b[:num] = self.buffer[self.pos:self.pos+num]
+        self.pos += num
+        return num
+
+    def readable(self):
+        return True
+
+    def close(self):
+        if not self.closed:
+            self.executor.shutdown(cancel_futures=True)
+            self.f.close()
+        super().close()
+
+def decompress_blocks(blocks):
+    '''
+    Decompress BGZF blocks (each block is a complete gzip member)
 
     Args:
-        lines (list): The list of Strings from the txt file, each line is a String
-        key (String): The key given by the user (standard:email) to sort by, i.e. most important information
-        df (pandas.Dataframe): Pandas dataframe object with len(lines)) rows and following columns: ['email', 'password','ip','url','phone_number','else','domain']
+        blocks (list): The compressed blocks (bytes)
 
     Returns:
-        dict_key (dict): A dictionary with the key as key and the index in the dataframe as value
-        df (pandas.Dataframe): The same Pandas dataframe object as in the input, but now the cells are filled with given information in the lines
-        
+        content (bytes): The decompressed content of all blocks
     '''
-    dict_key = {}
-    index=0
-    keep_index=0
-    for line in lines:
-        lst = re.split(';|,|\n|:| |\t',line)
-        words =[word.strip() for word in lst]
-        words = list(filter(None,words))
-        multiple_occur=False
-        email_exists=False
-        for i in range(len(words)):
-            word=words[i]
-            multiple_occur,keep_index,index,email_exists=label(df,index,key,dict_key,word,words,i,multiple_occur,keep_index,email_exists,0)
-        if ((email_exists==False) and (index==0)):
-            input_var=input("No email was found in the first line if you want to continue with email as key enter Y otherwise enter n: ")
-            if input_var=='Y':
-                continue
-            input_var = input("Choose a different key from: [password, ip, url, phone_number, else] and input the chosen word in the same spelling here: ")
-            print ("you entered " + input_var)
-            get_words_with_label(lines,input_var,df)
-        elif email_exists==False:#Those without a key (email address) as in the other lines won't be considered
-            df.loc[index] = ['','','','','','','other']
-            continue
-        if multiple_occur==False:
-            index+=1
-        else:
-            index=keep_index
-    df = df[df[key] != '']
-    df.dropna(subset=[key],inplace=True) ###Check if this is needed
-    return dict_key,df
+    return b''.join(zlib.decompress(block,31) for block in blocks)
 
 ######################################################################################
 #Functions that handle different input files
 
+def read_line_batches(file,buffer_size,offset=0,stop=None):
+    '''
+    Read a file in blocks of a bounded size and yield the complete lines in each block, 
+    so that the file never has to be read into memory as a whole. Compressed files and members of zip files are decompressed while they are read (see open_input).
+
+    Args:
+        file        (String): The file path from current directory
+        buffer_size (int): The number of bytes that are read at once
+        offset      (int): The byte position in the file from where to start reading
+        stop        (int): The byte position in the file where to stop reading (after a line break), None to read to the end of the file
+
+    Yields:
+        lines (list): The list of Strings in the block, each line is a String
+        end   (int): The byte position in the file up to which the file has been read
+
+    '''
+    with open_input(file) as f:
+        if offset>0:
+            f.seek(offset)
+        end = offset
+        rest = b''
+        while True:
+            block = f.read(buffer_size if stop is None else min(buffer_size,stop-end-len(rest)))
+            if not block:
+                break
+            block = rest+block
+            pos = block.rfind(b'\n')
+            if pos==-1:
+                #a line longer than the buffer, continue reading until it ends
+                rest = block
+                continue
+            rest = block[pos+1:]
+            end += pos+1
+            yield block[:pos].decode('UTF-8',errors='ignore').split('\n'),end
+        if rest:
+            yield [rest.decode('UTF-8',errors='ignore')],end+len(rest)
+
+def scan_email_lines(file,buffer_size,offset=0,stop=None):
+    '''
+    Scan a file through a memory map for lines that can contain an email address.
+    If at most scan_email_rate of the lines in the first scan_sample_size bytes of a block have an '@', the scanner works on the bytes of the block: 
+    it searches the next '@' and cuts out the line around it, all lines without an '@' are skipped without being decoded and the found lines are decoded at once. 
+    Otherwise jumping from '@' to '@' is slower than decoding, then all lines of the block are decoded and yielded like in read_line_batches.
+    This is only a prefilter, the email addresses are checked as before when the lines are split into words.
+    The interface is the same as the one of read_line_batches.
+
+    Args:
+        file        (String): The file path from current directory
+        buffer_size (int): The number of bytes that are scanned at once
+        offset      (int): The byte position in the file from where to start scanning
+        stop        (int): The byte position in the file where to stop scanning (after a line break), None to scan to the end of the file
+
+    Yields:
+        lines (list): The list of Strings in the block that contain an '@', each line is a String
+        end   (int): The byte position in the file up to which the file has been scanned
+
+    '''
+    with open(file,'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if stop is not None:
+            size = min(size,stop)
+        if size<=offset:
+            return
+        with mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ) as mm:
+            start = offset
+            while start<size:
+                #each block ends after the last line break in the next buffer_size bytes, a line longer than the buffer is scanned completely
+                if start+buffer_size>=size:
+                    end = size
+                else:
+                    end = mm.rfind(b'\n',start,start+buffer_size)
+                    if end==-1:
+                        end = mm.find(b'\n',start+buffer_size)
+                    end = size if end==-1 else end+1
+                block = mm[start:end]
+                sample = block[:scan_sample_size]
+                if sample.count(b'@')>scan_email_rate*sample.count(b'\n'):
+                    #many lines have an '@', jumping is slower than decoding, the block is decoded like in read_line_batches
+                    yield block[:-1 if block.endswith(b'\n') else None].decode('UTF-8',errors='ignore').split('\n'),end
+                    start = end
+                    continue
+                lines = []
+                pos = 0
+                while True:
+                    at = block.find(b'@',pos)
+                    if at==-1:
+                        break
+                    line_start = block.rfind(b'\n',0,at)+1
+                    line_end = block.find(b'\n',at)
+                    if line_end==-1:
+                        line_end = len(block)
+                    lines.append(block[line_start:line_end])
+                    pos = line_end+1
+                yield (b'\n'.join(lines).decode('UTF-8',errors='ignore').split('\n') if lines else []),end
+                start = end
+
 def handle_text_file(file,key,out_format,mult_files):
     '''
-    Analyse the input txt file and outputs a file in a specified format
+    Analyse the input txt file in the streaming mode and outputs a file in a specified format.
+    The file is read in blocks of buffer_size bytes and each block is handled separately.
+    If the key is email, only the lines that can contain an email address are read (see scan_email_lines).
 
     Args:
         file       (String): The file path from current directory
@@ -574,53 +2431,76 @@ def handle_text_file(file,key,out_format,mult_files):
         void
 
     '''
+    print("File is read in blocks of ",buffer_size," bytes.")
+    start = get_checkpoint_offset(file)
+    if start>0:
+        print("The file has already been processed up to byte ",start," in a previous run.")
+    read_blocks = scan_email_lines if key=='email' else read_line_batches
+    if pipeline:
+        with metrics.stage('schedule'):
+            asyncio.run(run_pipeline(read_blocks(file,buffer_size,start),file,key,out_format,True))
+        return
+    for lines,end in metrics.timed(read_blocks(file,buffer_size,start)):
+        metrics.add_bytes(end-start)
+        handle_lines(lines,file,key,out_format,mult_files)
+        mark_chunk_done(file,start,end)
+        start = end
+        #all following blocks are appended to the results of the first one
+        mult_files = True
+
+def handle_lines(lines,file,key,out_format,mult_files):
+    '''
+    Analyse the lines of an input txt file and outputs them in a specified format
+
+    Args:
+        lines      (list): The list of Strings from the txt file, each line is a String
+        file       (String): The file path from current directory
+        key        (String): The key given by the user (standard:email) to sort by, i.e. most important information
+        out_format (String): The user-specified output format
+        mult_files (boolean): Signals whether the lines are appended to existing results
     
-    ###LATER CHANGE SO THAT KEY CAN BE SOMETHING ELSE+CREATE SOMETHING FOR LINES THAT DON'T HAVE AN EMAIL ADDRESS, like list
-    with open(file,encoding='UTF-8',errors="ignore") as f:
-        print("File was opened successfully!")
-        lines = f.readlines()
+    Returns:
+        void
+
+    '''
     #Now see what pattern the rows i.e. each line has
     #best case every line is the same as the first line, worst case every line is individually different
     if out_format=='.txt':
-        dict_key = get_words_without_label(lines,key)
+        with metrics.stage('parse'):
+            dict_key = get_words_without_label(lines,key,input_layout)
         if key=='email':
             find_email_domains_txt(dict_key,mult_files)
-        elif (mult_files==True and (os.path.isfile('results/other.txt'))):
-            infos=list(dict_key.values())
-            with open('results/other.txt','a') as f:
-                for i in range(len(infos)):
-                    f.write(', '.join(list(filter(None,infos[i])))+'\n')
         else:
-            infos=list(dict_key.values())
-            with open('results/other.txt','w+') as f:
-                for i in range(len(infos)):
-                    f.write(', '.join(infos[i])+'\n')
+            #results/other.txt is created empty at the start of the run, so the lines can always be appended
+            result_writer.write(output_dir+'results/other.txt',dict_key.line_views())
     elif out_format=='.xlsx': 
-        #Create name of results xlsx file and make sure to delete any file with the same name in the directory
-        file_name = file.split('/')[-1].strip('.txt')
-        results_file_xlsx = 'result_'+file_name+'.xlsx'
-        if os.path.isfile(results_file_xlsx):
-            os.remove(results_file_xlsx)
-        print(results_file_xlsx)
-        df = pd.DataFrame(np.array([['','','','','','','other']]*len(lines)),columns = ['email', 'password','ip','url','phone_number','else','domain'])
-        dict_key,df = get_words_with_label(lines,key,df)
+        with metrics.stage('label'):
+            dict_key,df = get_words_with_label(lines,key,input_layout)
+        if key=='email':
+            find_email_domains_other(df,dict_key,mult_files,output_dir+'results.xlsx',out_format)
+        else:
+            df['domain'] = 'other'
+            with metrics.stage('write'):
+                excel_writer.write(df)
+    elif out_format=='.parquet':
+        with metrics.stage('label'):
+            dict_key,df = get_words_with_label(lines,key,input_layout)
         if key=='email':
-            find_email_domains_other(df,dict_key,True,results_file_xlsx,out_format)
-        elif (mult_files==True and (os.path.isfile(results_file_xlsx))):
-            append_df_to_excel(['other'],df,results_file_xlsx)
+            find_email_domains_other(df,dict_key,mult_files,output_dir+'results.parquet',out_format)
         else:
-            with pd.ExcelWriter(results_file_xlsx) as writer:  
-                df.to_excel(writer,sheet_name='other')
+            df['domain'] = 'other'
+            with metrics.stage('write'):
+                parquet_writer.write(df)
     else: #out_format=='csv'
         print()
-        df = pd.DataFrame(np.array([['','','','','','','other']]*len(lines)),columns = ['email', 'password','ip','url','phone_number','else','domain'])
-        dict_key,df = get_words_with_label(lines,key,df)
+        with metrics.stage('label'):
+            dict_key,df = get_words_with_label(lines,key,input_layout)
         if key=='email':
-            find_email_domains_other(df,dict_key,True,'results.csv',out_format)
-        if ((mult_files==False) or (not os.path.isfile('results.csv'))):
-            df.to_csv('results.csv',header='column_names')
+            find_email_domains_other(df,dict_key,mult_files,output_dir+'results.csv',out_format)
         else:
-            df.to_csv('results.csv',mode='a', header=False)
+            with metrics.stage('write'):
+                csv_writer.write(df)
+    metrics.chunk(file,len(lines))
 
 def check_if_email(df):
     '''
@@ -646,9 +2526,82 @@ def check_if_email(df):
             return col
     return None
 
+def read_csv_batches(file,batch_size):
+    '''
+    Read the rows of a csv file with the csv module and yield them in batches of lines, the header (first row) is skipped.
+    The cells of each row are joined with spaces, so that the rows can be handled like the lines of a txt file.
+
+    Args:
+        file       (String): The file path from current directory
+        batch_size (int): The approximate number of characters in one batch
+
+    Yields:
+        lines (list): The list of Strings in the batch, each row is a String
+    '''
+    with io.TextIOWrapper(open_input(file),newline='',encoding='UTF-8',errors='ignore') as f:
+        reader = csv.reader(f)
+        next(reader,None)
+        lines = []
+        size = 0
+        for row in reader:
+            line = ' '.join(row)
+            lines.append(line)
+            size += len(line)
+            if size>=batch_size:
+                yield lines
+                lines = []
+                size = 0
+        if lines:
+            yield lines
+
+def read_xlsx_batches(file,batch_size):
+    '''
+    Read the rows of all sheets of an excel file with a read-only (streaming) workbook and yield them in batches of lines, 
+    the header (first row) of each sheet is skipped.
+    The cells of each row are joined with spaces, so that the rows can be handled like the lines of a txt file.
+
+    Args:
+        file       (String): The file path from current directory
+        batch_size (int): The approximate number of characters in one batch
+
+    Yields:
+        lines (list): The list of Strings in the batch, each row is a String
+    '''
+    try:
+        from openpyxl import load_workbook
+    except ImportError as error:
+        error_output("when reading the xlsx file, please install openpyxl", error, 1)
+    f = open_input(file)
+    if not f.seekable():
+        #a compressed excel file is decompressed into the memory, because openpyxl needs to seek in the file
+        f = io.BytesIO(f.read())
+    workbook = load_workbook(f,read_only=True,data_only=True)
+    try:
+        lines = []
+        size = 0
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            next(rows,None)
+            for row in rows:
+                line = ' '.join(str(cell) for cell in row if cell is not None)
+                if not line:
+                    continue
+                lines.append(line)
+                size += len(line)
+                if size>=batch_size:
+                    yield lines
+                    lines = []
+                    size = 0
+        if lines:
+            yield lines
+    finally:
+        workbook.close()
+        f.close()
+
 def handle_csv_file(file,key,out_format,in_format,mult_files):
     '''
-    Analyse the input csv/excel file and outputs a file in a specified format
+    Analyse the input csv/excel file and outputs a file in a specified format.
+    The rows are read in batches directly from the file (see read_csv_batches and read_xlsx_batches) and each batch is handled like the lines of a txt file.
 
     Args:
         file       (String): The file path from current directory
@@ -661,40 +2614,65 @@ def handle_csv_file(file,key,out_format,in_format,mult_files):
         void
 
     '''
-    
+    batch_size = buffer_size if buffer_size is not None else default_buffer_size
     if in_format=='.csv':
-        txt_file = file.strip('.csv')+'.txt'
-        try:
-            subprocess.check_output('cat '+file+' | tr "," " " > '+txt_file,shell=True)
-        except subprocess.CalledProcessError as error:
-            error_output("when converting csv to txt", error, 1)
-        #Delete first line
-        try:
-            subprocess.check_output('sed -i "1d" '+txt_file,shell=True)
-        except subprocess.CalledProcessError as error:
-            error_output("when deleting first line in newly created text file", error, 1)
-        handle_text_file(txt_file,key,out_format,mult_files)
+        batches = read_csv_batches(file,batch_size)
     else: #in_format == '.xlsx'
-        csv_file = file.strip('.xlsx')+'.csv'
-        txt_file = file.strip('.xlsx')+'.txt'
-        try:
-            #if xlsx2csv is not downloaded, please download this!!
-            subprocess.check_output('xlsx2csv '+file+' --all > '+csv_file,shell=True)
-        except subprocess.CalledProcessError as error:
-            error_output("when converting csv to txt", error, 1)
-        try:
-            subprocess.check_output('cat '+csv_file+' | tr "," " " > '+txt_file,shell=True)
-        except subprocess.CalledProcessError as error:
-            error_output("when converting csv to txt", error, 1)
-        #Delete first line
-        try:
-            subprocess.check_output('sed -i "1d" '+txt_file,shell=True)
-        except subprocess.CalledProcessError as error:
-            error_output("when deleting first line in newly created text file", error, 1)
-        
-        handle_text_file(txt_file,key,out_format,mult_files)
+        batches = read_xlsx_batches(file,batch_size)
+    for lines in metrics.timed(batches):
+        #the rows have no byte positions in the (possibly compressed) file, the length of their text is counted instead
+        metrics.add_bytes(sum(len(line)+1 for line in lines))
+        handle_lines(lines,file,key,out_format,mult_files)
+        #all following batches are appended to the results of the first one
+        mult_files = True
+
+def handle_stream_file(file,key,out_format,mult_files):
+    '''
+    Analyse an input txt file that can only be read as a stream (a compressed file or a member of a zip file) and outputs a file in a specified format.
+    The file is decompressed while it is read (see open_input) and each block of lines is handled separately.
+
+    Args:
+        file       (String): The file path from current directory
+        key        (String): The key given by the user (standard:email) to sort by, i.e. most important information
+        out_format (String): The user-specified output format
+        mult_files (boolean): Signals whether the input was a folder or a single file
+    
+    Returns:
+        void
+
+    '''
+    batch_size = buffer_size if buffer_size is not None else default_buffer_size
+    if pipeline:
+        with metrics.stage('schedule'):
+            asyncio.run(run_pipeline(read_line_batches(file,batch_size),file,key,out_format,False))
+        return
+    start = 0
+    for lines,end in metrics.timed(read_line_batches(file,batch_size)):
+        #the bytes of a block are counted after the decompression
+        metrics.add_bytes(end-start)
+        start = end
+        handle_lines(lines,file,key,out_format,mult_files)
+        #all following blocks are appended to the results of the first one
+        mult_files = True
+
+def handle_zip_file(file,key,out_format):
+    '''
+    Handle all members of a zip file like the files of a folder, the members are read directly from the zip file (i.e. leaks.zip/2021/leak.txt)
+
+    Args:
+        file       (String): The path of the zip file
+        key        (String): The key given by the user (standard:email) to sort by, i.e. most important information
+        out_format (String): The user-specified output format
+    
+    Returns:
+        void
 
-    return
+    '''
+    with zipfile.ZipFile(file) as zip_file:
+        members = [info.filename for info in zip_file.infolist() if not info.is_dir()]
+    print(members)
+    for member in members:
+        type_of_file(file+'/'+member,key,out_format,True)
 
 def handle_folder(folder,key,out_format):
     '''
@@ -722,35 +2700,279 @@ def handle_folder(folder,key,out_format):
         else:
             type_of_file(file,key,out_format,True)
 
-def split_file(file,ending):
+##Scheduler for the chunks of the input files###############################
+
+class ChunkResults:
+    '''
+    Collects the results of a chunk in a process of the worker pool instead of writing them. 
+    It is used in place of the result writers (same write method), the main process writes the collected results (see write_chunk_results).
+    '''
+
+    def __init__(self):
+        self.writes = []
+
+    def write(self,result,lines=None):
+        '''
+        Collect the lines for a txt result file or the rows of a dataframe
+
+        Args:
+            result (String or pandas.Dataframe): The path of the txt result file or the dataframe with the rows
+            lines  (list): The lines for the txt result file (Strings or UTF-8 encoded bytes/memoryviews), None for a dataframe
+        '''
+        if lines is None:
+            self.writes.append((result,None))
+        elif lines:
+            #the memoryviews point into the store of the chunk, they are copied so that they can be sent to the main process
+            self.writes.append((result,[line if isinstance(line,str) else bytes(line) for line in lines]))
+
+def process_chunk(task):
     '''
-    Split a large file into a few smaller files, so that there are no memory errors
+    Handle a chunk of a txt file in a process of the worker pool: the lines are read, parsed and classified as in the main process,
+    but the results are collected (see ChunkResults) and sent back to the main process.
 
     Args:
-        file    (String): The file path of the input file
-        ending  (String): The input file ending
-    
+        task (tuple): The position of the chunk in the schedule, the file, the start and end of the chunk, the key, the layout of the file, 
+                      the output format, if the passwords are censored and the lines of the chunk 
+                      (None if the worker reads the chunk, the lines if they were already read by the main process, see run_pipeline)
+
+    Returns:
+        index   (int): The position of the chunk in the schedule
+        writes  (list): The collected results (see ChunkResults)
+        records (int): The number of lines in the chunk
+        worker  (int): The process id of the worker
+        seconds (float): The time the worker needed for the chunk
+        stages  (dict): The time of each stage in the worker
+    '''
+    global result_writer, excel_writer, parquet_writer, csv_writer, metrics, censor_password, input_layout
+    index,file,start,end,key,layout,out_format,censor,lines = task
+    begin = time.perf_counter()
+    metrics = Metrics()
+    censor_password = censor
+    input_layout = layout
+    results = ChunkResults()
+    result_writer = excel_writer = parquet_writer = csv_writer = results
+    if lines is None:
+        with metrics.stage('read'):
+            lines = read_chunk(file,start,end,key)
+    handle_lines(lines,file,key,out_format,True)
+    return index,results.writes,len(lines),os.getpid(),time.perf_counter()-begin,metrics.stages
+
+def write_chunk_results(writes,out_format):
+    '''
+    Write the collected results of a chunk with the writers of the main process
+
+    Args:
+        writes     (list): The collected results (see ChunkResults)
+        out_format (String): The user-specified output format
+    '''
+    writers = {'.txt':result_writer,'.xlsx':excel_writer,'.parquet':parquet_writer,'.csv':csv_writer}
+    with metrics.stage('write'):
+        for result,lines in writes:
+            if lines is None:
+                writers[out_format].write(result)
+            else:
+                result_writer.write(result,lines)
+
+def run_scheduled_chunks(out_format):
+    '''
+    Handle all scheduled chunks of the txt inputs in the worker pool. The chunks are dispatched in their order (the order of the inputs and of the chunks in each file),
+    at most 2*num_workers chunks are in the pool at once, so every worker takes the next chunk as soon as it is idle 
+    while only the results of a few chunks are kept in memory. The results are written in the order of the chunks as soon as 
+    all previous chunks are written (and the chunk is noted in the checkpoint manifest), so the output does not depend on which worker was faster.
+
+    Args:
+        out_format (String): The user-specified output format
+
     Returns:
         void
+    '''
+    tasks = scheduled_chunks
+    print('The ',len(tasks),' chunks of the input files are handled in ',num_workers,' processes, the progressbar shows how many chunks have been handled.')
+    window = 2*num_workers
+    jobs = deque()
+    with metrics.stage('schedule'):
+        for task in tqdm(tasks):
+            jobs.append(worker_pool.apply_async(process_chunk,(task,)))
+            if len(jobs)>=window:
+                write_scheduled_chunk(jobs.popleft().get(),out_format)
+        while jobs:
+            write_scheduled_chunk(jobs.popleft().get(),out_format)
+
+def write_scheduled_chunk(result,out_format):
+    '''
+    Write the results of a chunk that has been handled in the worker pool and note the chunk in the checkpoint manifest
+
+    Args:
+        result     (tuple): The return value of process_chunk
+        out_format (String): The user-specified output format
 
+    Returns:
+        void
+    '''
+    index,writes,records,worker,seconds,stages = result
+    _,file,start,end = scheduled_chunks[index][:4]
+    metrics.add_worker_time(worker,seconds,records)
+    metrics.add_stages(stages)
+    write_chunk_results(writes,out_format)
+    metrics.add_bytes(end-start)
+    metrics.chunk(file,records)
+    mark_chunk_done(file,start,end)
+
+def plan_chunks(file,chunk_size,offset=0):
     '''
+    Plan the chunks of a txt file as byte ranges, each range ends after a line break (or at the end of the file)
 
-    file_name=file.split('/')[-1].strip(ending)
-    print(file_name)
-    if not os.path.exists('splitfiles/'):
-        os.mkdir('splitfiles/')
-    if not os.path.exists('splitfiles/'+file_name):
-        os.mkdir('splitfiles/'+file_name)    
-    fs = Filesplit()
-    #Change split_size if there are memory issues!! 
-    num = 50000000
-    mb = num//1000000
-    print('All input files will be split at ',mb,' megabytes.\n')
-    fs.split(file=file, split_size=num, output_dir=os.path.abspath(os.getcwd())+'/splitfiles/'+file_name,newline=True)
-    split_files = get_paths(os.path.abspath(os.getcwd())+'/splitfiles/'+file_name,False)
-    split_files = [val for val in split_files if not val.endswith("fs_manifest.csv")]
-    
-    return split_files
+    Args:
+        file       (String): The file path from current directory
+        chunk_size (int): The approximate number of bytes in one chunk
+        offset     (int): The byte position in the file where the first chunk starts
+
+    Returns:
+        chunks (list): List of (start, end) byte positions of each chunk
+    '''
+    size = os.path.getsize(file)
+    chunks = []
+    with open(file,'rb') as f:
+        start = offset
+        while start<size:
+            f.seek(min(start+chunk_size,size)-1)
+            f.readline()
+            end = min(f.tell(),size)
+            chunks.append((start,end))
+            start = end
+    return chunks
+
+def available_memory():
+    '''
+    Get the memory that is available for new processes (MemAvailable of /proc/meminfo, or the free physical memory)
+
+    Returns:
+        memory (int): The available memory in bytes, None if it is not known on this system
+    '''
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1])*1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES')*os.sysconf('SC_PAGE_SIZE')
+    except (ValueError,OSError,AttributeError):
+        return None
+
+def get_chunk_size(file):
+    '''
+    Get the size of the chunks of a txt file. A chunk (and the data points that are parsed from it) has to fit into the memory 
+    next to the chunks of the other workers, with the worker pool there are also at least four chunks per worker so that all cores are busy until the end.
+    The size can be set with --chunk-size=<bytes>.
+
+    Args:
+        file (String): The file path from current directory
+
+    Returns:
+        chunk_size (int): The number of bytes in one chunk
+    '''
+    if chunk_size is not None:
+        return chunk_size
+    memory = available_memory()
+    #the parsed data points need several times the memory of the bytes of a chunk
+    max_size = memory//(memory_factor*max(1,num_workers)) if memory is not None else default_chunk_size
+    size = os.path.getsize(file)
+    if worker_pool is not None:
+        size = -(-size//(num_workers*4))
+    return max(min_chunk_size,min(size,max_size))
+
+def read_chunk(file,start,end,key):
+    '''
+    Read the lines of a chunk of a txt file, if the key is email only the lines that can contain an email address (see scan_email_lines)
+
+    Args:
+        file  (String): The file path from current directory
+        start (int): The byte position where the chunk starts
+        end   (int): The byte position where the chunk ends
+        key   (String): The key of the data points
+
+    Returns:
+        lines (list): The list of Strings in the chunk, each line is a String
+    '''
+    read_blocks = scan_email_lines if key=='email' else read_line_batches
+    lines = []
+    for block_lines,_ in read_blocks(file,end-start,start,end):
+        lines.extend(block_lines)
+    return lines
+
+async def run_pipeline(blocks,file,key,out_format,checkpoint_blocks):
+    '''
+    Handle the blocks of an input file in a pipeline (--pipeline): the blocks are read in a thread, parsed and classified in the worker pool 
+    and written in a thread, all three stages run at the same time and are connected by bounded queues. 
+    At most pipeline_depth blocks are read ahead and at most max(pipeline_depth,2*num_workers) blocks are in the worker pool or wait to be written, 
+    so all workers can be busy. If the writer falls behind, the queues fill up and the reader waits (backpressure), so the number of blocks in memory is bounded.
+    The blocks are written in the order in which they were read.
+
+    Args:
+        blocks            (generator): The blocks of lines with the byte position up to which the file has been read (see read_line_batches)
+        file              (String): The file path from current directory
+        key               (String): The key of the data points
+        out_format        (String): The user-specified output format
+        checkpoint_blocks (boolean): True if each block is noted in the checkpoint manifest, False if the file can only be read as a whole (compressed files)
+
+    Returns:
+        void
+    '''
+    loop = asyncio.get_running_loop()
+    read_queue = asyncio.Queue(maxsize=pipeline_depth)
+    #like in run_scheduled_chunks each worker can have a block in work and one waiting
+    result_queue = asyncio.Queue(maxsize=max(pipeline_depth,2*num_workers))
+
+    def read_block():
+        with metrics.stage('read'):
+            return next(blocks,None)
+
+    def submit(task):
+        future = loop.create_future()
+        worker_pool.apply_async(process_chunk,(task,),
+                                callback=lambda result: loop.call_soon_threadsafe(future.set_result,result),
+                                error_callback=lambda error: loop.call_soon_threadsafe(future.set_exception,error))
+        return future
+
+    async def read():
+        while True:
+            block = await loop.run_in_executor(None,read_block)
+            await read_queue.put(block)
+            if block is None:
+                return
+
+    async def parse():
+        index = 0
+        start = get_checkpoint_offset(file) if checkpoint_blocks else 0
+        while True:
+            block = await read_queue.get()
+            if block is None:
+                await result_queue.put(None)
+                return
+            lines,end = block
+            future = submit((index,file,start,end,key,input_layout,out_format,censor_password,lines))
+            await result_queue.put((future,start,end))
+            index += 1
+            start = end
+
+    async def write():
+        while True:
+            item = await result_queue.get()
+            if item is None:
+                return
+            future,start,end = item
+            index,writes,records,worker,seconds,stages = await future
+            metrics.add_worker_time(worker,seconds,records)
+            metrics.add_stages(stages)
+            await loop.run_in_executor(None,write_chunk_results,writes,out_format)
+            metrics.add_bytes(end-start)
+            metrics.chunk(file,records)
+            if checkpoint_blocks:
+                await loop.run_in_executor(None,mark_chunk_done,file,start,end)
+
+    await asyncio.gather(read(),parse(),write())
 
 def type_of_file(file,key,out_format,mult_files):
     '''
@@ -767,53 +2989,72 @@ def type_of_file(file,key,out_format,mult_files):
 
     '''
     print()
-    if file.lower().endswith('.txt'):
+    if file.lower().endswith('.zip') and os.path.isfile(file):
+        print('The input given is a zip file, its members are read directly from the zip file.')
+        handle_zip_file(file,key,out_format)
+        return
+    in_format,compression = input_format(file)
+    if in_format is not None:
+        entry = register_input_file(file)
+        if entry['offset']>=entry['size']:
+            print('The file ',file,' has already been processed in a previous run and is skipped.')
+            return
+        if resume:
+            #the results of the previous run are kept, everything is appended to them
+            mult_files = True
+        #the key and the layout are detected once per input file from a sample of its lines
+        global input_layout
+        key,input_layout = detect_input(file,key)
+    if compression is not None:
+        print('The input file is compressed (',compression[1:],'), it is decompressed while it is read.')
+    if in_format in ('.csv','.xlsx'):
+        print('The input file you want analysed has been recognised as a ',in_format[1:],' format.')
+        print('Processing will now continue.\n')
+        #The rows are read in batches, so the file does not have to be split
+        handle_csv_file(file,key,out_format,in_format,mult_files)
+        mark_chunk_done(file,0,entry['size'])
+        return
+    if in_format=='.txt' and is_stream_input(file):
+        #A compressed file (or a member of a zip file) can not be split into byte ranges, it is read as one stream
+        handle_stream_file(file,key,out_format,mult_files)
+        mark_chunk_done(file,0,entry['size'])
+        return
+    if scheduled_chunks is not None and in_format=='.txt':
+        #The chunks are only planned here, they are handled in the worker pool when all inputs are known (see run_scheduled_chunks)
+        chunks = [chunk for chunk in plan_chunks(file,get_chunk_size(file),entry['offset']) if not is_chunk_done(file,*chunk)]
+        print('The input file ',file,' is handled in ',len(chunks),' chunks in the worker pool.')
+        for start,end in chunks:
+            scheduled_chunks.append((len(scheduled_chunks),file,start,end,key,input_layout,out_format,censor_password,None))
+        return
+    if buffer_size is not None and in_format=='.txt':
+        #In the streaming mode the file is not split, but read in blocks
+        print('The input file will be streamed in blocks of ',buffer_size,' bytes.\n')
+        handle_text_file(file,key,out_format,mult_files)
+        return
+    if in_format=='.txt':
         print('The input file you want analysed has been recognised as a text format.')
         print('Processing will now continue.\n')
-        #Split file so that there is no memory error into chunks of 30 MB#
-        split_files = split_file(file,'.txt')
-        print('These are the split files that will now be processed separately: ')
-        print(split_files)
+        #The file is not copied, each chunk is a byte range of the file that fits into the memory
+        chunks = plan_chunks(file,get_chunk_size(file),entry['offset'])
+        print('The file is handled in ',len(chunks),' chunks (byte ranges): ',chunks)
         print()
-        if len(split_files)>1:
+        if len(chunks)>1:
             mult_files=True
-        for f in split_files: #for every splitted file check domains
-            print('Now handling: ',f)
+        for start,end in chunks:
+            if is_chunk_done(file,start,end):
+                print('Already handled in a previous run: ',start,'-',end)
+                continue
+            print('Now handling bytes ',start,'-',end)
             print()
-            handle_text_file(f,key,out_format,mult_files)
-        shutil.rmtree('splitfiles/'+file.split('/')[-1].strip('.txt'), ignore_errors=True) #remove all split files after
+            with metrics.stage('read'):
+                lines = read_chunk(file,start,end,key)
+            print("File was read successfully!")
+            metrics.add_bytes(end-start)
+            handle_lines(lines,file,key,out_format,mult_files)
+            mark_chunk_done(file,start,end)
         return
 
-    elif file.lower().endswith('.csv'):
-        print('The input file you want analysed has been recognised as a csv format.')
-        print('Processing will now continue.\n')
-        #Split file so that there is no memory error into chunks of 30 MB#
-        split_files = split_file(file,'.csv')
-        print('These are the split files that will now be processed separately: ')
-        print(split_files)
-        if len(split_files)>1:
-            mult_files=True
-        for f in split_files: #for every splitted file check domains
-            print('Now handling: ',f)
-            print()
-            handle_csv_file(file,key,out_format,'.csv',mult_files)
-        shutil.rmtree('splitfiles/'+file.split('/')[-1].strip('.csv'), ignore_errors=True)
-        
-    elif file.lower().endswith('.xlsx'):
-        print('The input file you want analysed has been recognised as a xlsx format.')
-        print('Processing will now continue.\n')
-        #Split file so that there is no memory error into chunks of 30 MB#
-        split_files = split_file(file,'.xlsx')
-        print('These are the split files that will now be processed separately: ')
-        print(split_files)
-        if len(split_files)>1:
-            mult_files=True
-        for f in split_files: #for every splitted file check domains
-            print('Now handling: ',f)
-            print()
-            handle_csv_file(file,key,out_format,'.xlsx',mult_files)
-        shutil.rmtree('splitfiles/'+file.split('/')[-1].strip('.xlsx'), ignore_errors=True)
-    elif os.path.isdir(file):  
+    if os.path.isdir(file):  
         print("The input given is a folder.")  
         handle_folder(file,key,out_format)
     else:
@@ -830,11 +3071,99 @@ def main():
     args_lst = [arg for arg in sys.argv]
     #Assuming the 0th argument is 'test.py' remove that from args_lst
     args_lst.pop(0)
+    #options for the streaming mode and the multiprocessing
+    global buffer_size
+    global chunk_size
+    global num_workers
+    global resume
+    global metrics_file
+    global debug
+    global batch_mode
+    global pipeline
+    global fallback_key
+    global output_dir
+    global checkpoint_file
+    dedup_memory = None
+    metrics_option = None
+    key_option = None
+    format_option = None
+    censor_option = None
+    fallback_option = None
+    stream_option = False
+    #options from a config file (one option per line, i.e. 'workers=4') are read as if they were given before the other options
+    for arg in [arg for arg in args_lst if arg.startswith('--config=')]:
+        args_lst.remove(arg)
+        args_lst = read_config(arg.split('=',1)[1])+args_lst
+    for arg in [arg for arg in args_lst if arg.startswith('--')]:
+        if arg=='--stream':
+            stream_option = True
+        elif arg=='--resume':
+            resume = True
+        elif arg.startswith('--dedup-memory='):
+            dedup_memory = int(arg.split('=',1)[1])
+        elif arg.startswith('--buffer-size='):
+            buffer_size = int(arg.split('=',1)[1])
+        elif arg.startswith('--chunk-size='):
+            chunk_size = int(arg.split('=',1)[1])
+        elif arg.startswith('--workers='):
+            num_workers = int(arg.split('=',1)[1])
+        elif arg.startswith('--metrics='):
+            metrics_option = arg.split('=',1)[1]
+        elif arg=='--debug':
+            debug = True
+        elif arg=='--pipeline':
+            pipeline = True
+        elif arg=='--batch':
+            batch_mode = True
+        elif arg.startswith('--key='):
+            key_option = arg.split('=',1)[1]
+        elif arg.startswith('--format='):
+            format_option = arg.split('=',1)[1]
+        elif arg.startswith('--censor='):
+            censor_option = arg.split('=',1)[1]
+        elif arg.startswith('--fallback-key='):
+            fallback_option = arg.split('=',1)[1]
+        elif arg.startswith('--output-dir='):
+            output_dir = os.path.join(arg.split('=',1)[1],'')
+        else:
+            error_output("because the option "+arg+" is not known", "Known options are: --stream, --buffer-size=<bytes>, --chunk-size=<bytes>, --workers=<number>, --resume, --dedup-memory=<lines>, --metrics=<file>, --debug, --pipeline, --batch, --key=<key>, --format=<format>, --censor=<Y|n>, --fallback-key=<prompt|keep|auto|key>, --output-dir=<folder>, --config=<file>", 1)
+        args_lst.remove(arg)
+    if key_option is not None and key_option not in dict_regex and key_option!='else':
+        error_output("because the key "+key_option+" is not known", "Known keys are: password, email, ip, url, phone_number, else", 1)
+    if format_option is not None and format_option not in ['.txt','.csv','.xlsx','.parquet']:
+        error_output("because the output format "+format_option+" is not known", "Known output formats are: .txt, .csv, .xlsx, .parquet", 1)
+    if censor_option is not None and censor_option not in ['Y','n']:
+        error_output("because --censor has to be Y or n", censor_option, 1)
+    if fallback_option is not None and fallback_option not in ['prompt','keep','auto','else'] and fallback_option not in dict_regex:
+        error_output("because the fallback key "+fallback_option+" is not known", "Known values are: prompt, keep, auto, password, email, ip, url, phone_number, else", 1)
+    #in the batch mode the key is detected automatically if the first line has no word that matches the key
+    if fallback_option is not None:
+        fallback_key = fallback_option
+    elif batch_mode:
+        fallback_key = 'auto'
+    if not args_lst:
+        error_output("because no input and no Domain list folder were given", "Usage: python domain_check.py [options] [key] [format] file[s]/folder[s] Domainlisten", 1)
+    if stream_option and buffer_size is None:
+        #an explicit --buffer-size wins, no matter if it is given before or after --stream
+        buffer_size = default_buffer_size
+    if pipeline and buffer_size is None:
+        #the pipeline reads the input files in blocks as in the streaming mode
+        buffer_size = default_buffer_size
+    if output_dir and not os.path.isdir(output_dir):
+        try:
+            os.makedirs(output_dir)
+        except OSError as error:
+            error_output("when creating the output folder "+output_dir, error, 1)
+    #the checkpoint manifest and the metrics (if no other file is given) are written to the output folder as well
+    checkpoint_file = output_dir+checkpoint_file
+    metrics_file = metrics_option if metrics_option is not None else output_dir+metrics_file
+    global metrics
+    metrics = Metrics(metrics_file)
     global domains_folder_name
     domains_folder_name = args_lst[-1]
     if '.' in domains_folder_name:
         print('Make sure that the last argument given is a folder with Domain lists.')
-        input_val = input('If you want to proceed enter Y else enter n, then the program will terminate. ')
+        input_val = ask('If you want to proceed enter Y else enter n, then the program will terminate. ','Y' if os.path.isdir(domains_folder_name) else 'n')
         if input_val=='Y':
             pass
         else:
@@ -842,17 +3171,23 @@ def main():
             print('The program has been terminated because the last input was not a Domain list folder.')
             return
     args_lst.pop(-1)
+    #the Domainlist folder can be given relative to the current directory or as an absolute path
+    domains_folder_name = os.path.abspath(domains_folder_name)
     #if first input is a key, then key=input, else key='email'
     #if first or second input is an outputformat, then outputformat=input, else outputformat='.txt'
     if re.match(r'password|email|ip|url|phone_number|else',args_lst[0]):
         key=args_lst[0]
         args_lst.pop(0)
-        if re.match(r'.txt|.csv|.xlsx', args_lst[0]):
+        if re.match(r'.txt|.csv|.xlsx|.parquet', args_lst[0]):
             out_format = args_lst[0]
             args_lst.pop(0)
-    elif re.match(r'.txt|.csv|.xlsx', args_lst[0]):
+    elif re.match(r'.txt|.csv|.xlsx|.parquet', args_lst[0]):
         out_format = args_lst[0]
         args_lst.pop(0)
+    if key_option is not None:
+        key = key_option
+    if format_option is not None:
+        out_format = format_option
     print()
     print('The following file[s]/folder[s] were given as input: ')
     print(args_lst)
@@ -860,58 +3195,91 @@ def main():
     print('The following was selected (if nothing was given as the 1st or 2nd argument then the program standard was selected):')
     print('key: ',key)
     print('output format: ',out_format,'\n')
-    if os.path.exists('results/'):
-        try:
-            subprocess.check_output('rm -r '+'results',shell=True)
-        except subprocess.CalledProcessError as error:
-            error_output("when removing directory 'results'", error, 1)
+    file_paths=get_paths(domains_folder_name,False)
+    if not file_paths:
+        error_output("because the Domain list folder "+domains_folder_name+" does not exist or contains no files", "Please give the folder with the Domain lists as the last argument", 1)
+    #with --resume the results of the previous run are kept and only the chunks that are not in the checkpoint manifest are processed
+    global checkpoint
+    version = domain_index_version(file_paths)
+    if resume:
+        checkpoint = load_checkpoint(version,key,out_format)
+        if checkpoint is None:
+            resume = False
+        else:
+            print('The previous run is resumed, all new results are appended.')
+    if not resume:
+        checkpoint = {'domain_index_version':version,'key':key,'out_format':out_format,'files':{}}
+        if os.path.exists(output_dir+'results/'):
+            try:
+                shutil.rmtree(output_dir+'results')
+            except OSError as error:
+                error_output("when removing directory "+output_dir+"results", error, 1)
+        if out_format=='.csv' and os.path.isfile(output_dir+'results.csv'):
+            os.remove(output_dir+'results.csv')
+        if out_format=='.xlsx':
+            for file in os.listdir(output_dir or '.'):
+                if re.fullmatch(r'results(_[0-9]+)?\.xlsx',file):
+                    os.remove(output_dir+file)
+        if out_format=='.parquet' and os.path.exists(output_dir+'results.parquet'):
+            shutil.rmtree(output_dir+'results.parquet')
+        save_checkpoint()
+    #build the domain index once for the whole run (or load it from the cache)
+    global domain_index
+    domain_index = get_domain_index(file_paths,version)
+    if not domain_index:
+        error_output("because the Domain lists in "+domains_folder_name+" contain no domains", "Please check the files in the Domain list folder", 1)
+    global worker_pool
+    worker_pool = start_worker_pool()
     if out_format=='.txt':
-        file_paths=get_paths(os.path.abspath(os.getcwd())+'/'+domains_folder_name,False)
         create_all_results_folders(file_paths)
-    elif out_format=='.csv':
-        if os.path.isfile('results.csv'):
-            os.remove('results.csv')
+        global result_writer
+        #the result writer makes sure that each line is only written once to a result file
+        result_writer = ResultWriter(dedup_memory=dedup_memory)
+    elif out_format=='.xlsx':
+        global excel_writer
+        #one streaming workbook for the whole run, with one sheet per domain file
+        excel_writer = ExcelResultWriter(output_dir+'results.xlsx',get_paths(domains_folder_name,True)[1]+['other'])
+    elif out_format=='.parquet':
+        global parquet_writer
+        #one parquet writer per domain file, each chunk is written as a row group
+        parquet_writer = ParquetResultWriter(output_dir+'results.parquet')
+    else: #out_format=='.csv'
+        global csv_writer
+        csv_writer = CsvResultWriter(output_dir+'results.csv')
 
     #ask user if the password should be censored
     print()
-    input_user = input('Should the password be censored? Enter Y if yes, else enter n: ')
+    if censor_option is not None:
+        input_user = censor_option
+    else:
+        input_user = ask('Should the password be censored? Enter Y if yes, else enter n: ','n')
     global censor_password
     if input_user=='Y':
         censor_password = True
     else:
         censor_password = False
 
+    global scheduled_chunks
+    if worker_pool is not None and buffer_size is None:
+        #all chunks of the txt inputs are collected first and then handled in the worker pool
+        scheduled_chunks = []
     for f in args_lst:
         #Check what type of file and if file-type is valid i.e. handled in this program
         type_of_file(f,key,out_format,False)
-    
-    #The program has almost finished
-    #In this part the results file is sorted and only the unique key+password(or other info) are left in the results file
-    if out_format=='.txt':
-        file_paths=get_paths(os.path.abspath(os.getcwd())+'/results',False)
-        for result_file in file_paths:
-            temp_file = 'results/temp.txt'
-            try:
-                subprocess.check_output('sort -u '+result_file+' > '+temp_file,shell=True)
-
-            except subprocess.CalledProcessError as error:
-                error_output("when selecting unique emails", error, 1)
-            try:
-                subprocess.check_output('cp '+temp_file+' '+result_file,shell=True)
-
-            except subprocess.CalledProcessError as error:
-                error_output("when selecting unique emails", error, 1)
-    try:
-        subprocess.check_output('rm '+'results/temp.txt',shell=True)
-
-    except subprocess.CalledProcessError as error:
-        error_output("when removing directory 'splitfiles'", error, 1)
-
-    try:
-        subprocess.check_output('rm -r '+'splitfiles',shell=True)
-
-    except subprocess.CalledProcessError as error:
-        error_output("when removing directory 'splitfiles'", error, 1)
+    if scheduled_chunks:
+        run_scheduled_chunks(out_format)
+    if worker_pool is not None:
+        worker_pool.close()
+        worker_pool.join()
+    if result_writer is not None:
+        result_writer.close()
+    if excel_writer is not None:
+        excel_writer.close()
+    if parquet_writer is not None:
+        parquet_writer.close()
+    if csv_writer is not None:
+        csv_writer.close()
+    metrics.close()
 
 if __name__ == "__main__":
     start = time.time()
@@ -5,6 +5,7 @@
 
 # coding=utf-8
 import gc
+import hashlib
 import multiprocessing as mp
 import os
 import re
@@ -108,56 +109,115 @@ def error_output(textmsg, errorcode, bol_programstop):
         exit(1)
 
 
-def check_emails_in_domain_txt(file,input_file):
+#Regex for the host of an email address, i.e. everything after the '@'
+host_regex = re.compile('@([A-Za-z0-9._%+-]+)')
+
+#Hashes of all lines that were written to each results file and the number of duplicate lines that were not written again
+seen_lines = {}
+duplicates = {}
+
+def build_domain_engine(file_paths):
     '''
-    Check for each email if its domain is in this file, only used for when the output file should be a txt file.
-    If an email has a domain from Domainlist, this is saved into results/ under the name of the Domainlist from where it is from
+    Compile all domains of the Domainlist once into one lookup table, so that the input file only has to be read once for all domains.
+    A line belongs to a domain if the host of an email address in the line is the domain or a subdomain of it.
 
     Args:
-        file (String): The file path of a Domainfile
-        input_file (String): The file path of the input file (or the split input file, which contains the emails)
-    
+        file_paths (list): All file_paths in Domainlisten
+
+    Returns:
+        domain_engine (dict): A dictionary with each (lowercased) domain as key and the list of results files of the domain files as value
+
+    '''
+    domain_engine = {}
+    for file in file_paths:
+        if '.txt' in file:
+            file_name = 'results/'+file.split('/'+domains_folder_name+'/',1)[1]
+        else:
+            file_name = 'results/'+file.split('/'+domains_folder_name+'/',1)[1]+'.txt'
+        with open(file) as f:
+            lines = f.readlines()
+        for line in lines:
+            line = line.strip().lower()
+            if line=='':
+                continue
+            file_names = domain_engine.setdefault(line,[])
+            if file_name not in file_names:
+                file_names.append(file_name)
+    return domain_engine
+
+
+def write_new_lines(file_name,lines):
+    '''
+    Append only the lines to a results file that have not been written to it before in this run
+
+    Args:
+        file_name (String): The path of the results file
+        lines (list): The lines that were found for the results file
+
     Returns:
         void
 
     '''
-    with open(file) as f:
-        lines = f.readlines()
-    lines = [line.strip() for line in lines]
-    if '.txt' in file:
-        file_name = 'results/'+file.split('/'+domains_folder_name+'/',1)[1]
-    else:
-        file_name = 'results/'+file.split('/'+domains_folder_name+'/',1)[1]+'.txt'
-    print('Currently checking from domainlist : ',file_name[7:])
-    for line in lines:
-        if line.strip()=='':
+    seen = seen_lines.setdefault(file_name,set())
+    new_lines = []
+    for line in sorted(lines):
+        line_hash = hashlib.blake2b(line.encode('UTF-8',errors='ignore'),digest_size=16).digest()
+        if line_hash in seen:
             continue
-        try:
-            #look for each domain in emails
-            #print(line)
-            line = line.split('.')
-            line = '\\.'.join(line)
-            line_upper = line.upper()
-            subprocess.check_output(
-                #"grep -E '\\b[A-Za-z0-9._%+-]+@[A-Za-z0-9._%+-]*[\\.|]'" +line+'\|'+line_upper+ "'\\b' " + input_file + " | sort | uniq >> " + file_name,
-                "grep --text -E '\\b@[A-Za-z0-9._%+-]*[\\.|]'" +line+'\|'+line_upper+ "'\\b' " + input_file + " | sort | uniq >> " + file_name,
-                shell=True)
-            #os.system("grep --text -E " + " '[A-Za-z0-9._%+-]+@[A-Za-z0-9._%+-]*[\\.|]" + line+ "' " + input_file + " > " +file_name + "s.txt")
+        seen.add(line_hash)
+        new_lines.append(line)
+    duplicates[file_name] = duplicates.get(file_name,0)+len(lines)-len(new_lines)
+    if new_lines:
+        with open(file_name,'a') as f:
+            f.write('\n'.join(new_lines)+'\n')
 
-        except subprocess.CalledProcessError as error:
-            error_output("beim Pruefen der Top-Level-Domains", error, 1)
 
-    print()
-    print('All emails in domain file: ',file_name[7:])
-    print()
-    with open(file_name) as f:
-        ls=f.readlines()
-    print(ls)
-    print()
-    print('--------------------')
-    print()
+def check_emails_in_domain_txt(input_file):
+    '''
+    Check for each line in the input file if the domain of one of its email addresses is in the Domainlist, only used for when the output file should be a txt file.
+    The input file is read exactly once, for each host the suffixes are looked up in the domain engine (i.e. for info@vgem-betzenstein.bayern.de: vgem-betzenstein.bayern.de, bayern.de, de).
+    If an email has a domain from Domainlist, the line is saved into results/ under the name of the Domainlist from where it is from and into results/all_bund.txt
+    All other lines are written to results/other.txt in the same pass.
 
-    return 
+    Args:
+        input_file (String): The file path of the input file (or the split input file, which contains the emails)
+    
+    Returns:
+        dict_results (dict): A dictionary with the results file as key and the list of lines that were found as value
+
+    '''
+    dict_results = {}
+    with open(input_file,encoding='UTF-8',errors="ignore") as f, open('results/other.txt','a') as other:
+        for line in f:
+            line = line.rstrip('\n')
+            #the Domainlist files of all emails in the line, each file gets the line only once (several suffixes or emails can match the same file)
+            found = {}
+            if '@' in line:
+                for host in host_regex.findall(line):
+                    host = host.lower().strip('.')
+                    while host:
+                        for file_name in domain_engine.get(host,()):
+                            found[file_name] = True
+                        host = host.partition('.')[2]
+            for file_name in found:
+                dict_results.setdefault(file_name,[]).append(line)
+            #save lines without an email from the Domainlist into the results/other.txt file
+            if not found:
+                other.write(line+'\n')
+    all_bund = []
+    for file_name,lines in dict_results.items():
+        write_new_lines(file_name,lines)
+        all_bund.extend(lines)
+        print()
+        print('All emails in domain file: ',file_name[8:])
+        print()
+        print(sorted(lines))
+        print()
+        print('--------------------')
+        print()
+    write_new_lines('results/all_bund.txt',all_bund)
+
+    return dict_results
 
 
 def find_email_domains_txt(input_file):
@@ -181,13 +241,9 @@ def find_email_domains_txt(input_file):
         os.mkdir(dirName)
     except FileExistsError:
         pass
-    #find all text files with domain names
-    file_paths = get_paths(os.path.abspath(os.getcwd())+'/'+domains_folder_name,False)
-    #classify each email address
+    #classify each email address in one pass over the input file
     print('Start of searching email domains. ')
-
-    for i in range(len(file_paths)):
-        check_emails_in_domain_txt(file_paths[i],input_file)
+    check_emails_in_domain_txt(input_file)
     
     end = time.time()
     diff = end-start
@@ -243,44 +299,11 @@ def handle_text_file(file,key,out_format):
 
     '''
     
-    with open(file,encoding='UTF-8',errors="ignore") as f:
-        print("File was opened successfully!")
-        lines = f.readlines()##Read in parts for bigger files??
-    #Now see what pattern the rows i.e. each line has
-    #best case every line is the same as the first line, worst case every line is individually different
     clean_file(file)
     if out_format=='.txt':
         if key=='email':
+            #the lines that are not in a Domainlist are written to results/other.txt in the same pass
             find_email_domains_txt(file)
-            file_paths = get_paths(os.path.abspath(os.getcwd())+'/'+domains_folder_name,False)
-            
-            #Change permission settings
-            try:
-                subprocess.check_output('chmod +x results/all_bund.txt',shell=True)
-            except subprocess.CalledProcessError as error:
-                error_output("when changing results/all_bund.txt file permission settings",error,1)
-            for i in range(len(file_paths)):
-                if file_paths[i].endswith('.txt'):
-                    result_file = 'results/'+file_paths[i].split('/'+domains_folder_name+'/',1)[1]
-                else:
-                    result_file = 'results/'+file_paths[i].split('/'+domains_folder_name+'/',1)[1]+'.txt'
-                #Change permission settings
-                try:
-                    subprocess.check_output('chmod +x '+result_file,shell=True)
-                except subprocess.CalledProcessError as error:
-                    error_output("when changing file permission settings of a file in results folder",error,1)
-                #Append the content of each domain file to all_bund file
-                try:
-                    subprocess.check_output('cat '+result_file+' >> results/all_bund.txt',shell=True)
-                except subprocess.CalledProcessError as error:
-                    error_output("when emails whose domains are in the Domainlist were appended to all_bund file",error,1)
-
-            #save emails that are not in a Domainlist into the results/other.txt file
-            #grep -Fvxf <lines-to-remove> <all-lines>
-            try:
-                subprocess.check_output('grep -Fxvf '+'results/all_bund.txt'+' '+file+' >> results/other.txt',shell=True)
-            except subprocess.CalledProcessError as error:
-                error_output("when emails whose domains are in the Domainlist were deleted from the input file",error,1)
         else:#Case when email is not the key
             print('The key is not the email address, hence the file will not be domain checked.')
             print('The sorted and cleaned version of the input file will be saved into results/other.txt')
@@ -506,6 +529,9 @@ def main():
     if out_format=='.txt':
         file_paths=get_paths(os.path.abspath(os.getcwd())+'/'+domains_folder_name,False)
         create_all_results_txtfiles(file_paths)
+        #compile all domains once for the whole run
+        global domain_engine
+        domain_engine = build_domain_engine(file_paths)
     elif out_format=='.csv':
         if os.path.isfile('results.csv'):
             os.remove('results.csv')
@@ -514,30 +540,14 @@ def main():
         type_of_file(f,key,out_format)
 
     #The program has almost finished
-    #In this part the results file is sorted and only the unique key+password(or other info) are left in the results file
+    #The results files were deduplicated while they were written, only the number of removed duplicates is shown
     if out_format=='.txt':
-        file_paths.append(os.path.abspath(os.getcwd()+'/'+domains_folder_name+'/all_bund'))
-        for domain_file in file_paths:
-            if domain_file.endswith('.txt'):
-                result_file = 'results/'+domain_file.split('/'+domains_folder_name+'/',1)[1]
-            else:
-                result_file = 'results/'+domain_file.split('/'+domains_folder_name+'/',1)[1]+'.txt'
-            temp_file = 'results/temp.txt'
-            try:
-                subprocess.check_output('sort -u '+result_file+' > '+temp_file,shell=True)
-
-            except subprocess.CalledProcessError as error:
-                error_output("when selecting unique emails", error, 1)
-            try:
-                subprocess.check_output('cp '+temp_file+' '+result_file,shell=True)
-
-            except subprocess.CalledProcessError as error:
-                error_output("when selecting unique emails", error, 1)
-        try:
-            subprocess.check_output('rm '+temp_file,shell=True)
-
-        except subprocess.CalledProcessError as error:
-            error_output("when selecting unique emails", error, 1)
+        print()
+        print('Duplicate lines that were removed from the results files:')
+        for file_name,num in sorted(duplicates.items()):
+            if num>0:
+                print(file_name,': ',num)
+        print()
 
     try:
         subprocess.check_output('rm -r '+'splitfiles',shell=True)